@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# Файл с версией индекса, который data_collector/indexer.py перезаписывает
+# после каждой пересборки коллекции Chroma.
+INDEX_VERSION_FILENAME = "index_version"
+
+
+def read_index_version(vector_db_path: str) -> str:
+    """Возвращает текущую версию векторного индекса (или пустую строку)."""
+    try:
+        with open(
+            os.path.join(vector_db_path, INDEX_VERSION_FILENAME), encoding="utf-8"
+        ) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+class SemanticAnswerCache:
+    """
+    Кэш готовых ответов, ключом которого служит эмбеддинг запроса.
+    Новый запрос, косинусная близость которого к сохраненному не ниже порога,
+    получает сохраненный ответ без обращения к Chroma и LLM.
+
+    Эмбеддинги хранятся в заранее выделенной матрице [max_entries x dim]:
+    запись занимает строку-слот, поиск — одно умножение матрицы на вектор.
+    На диск кэш сохраняет фоновый поток раз в save_interval секунд
+    (если были изменения) и close() при остановке, а не каждый put.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity_threshold: float,
+        persist_path: Optional[str] = None,
+        save_interval: float = 30.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path or None
+        self.save_interval = save_interval
+        self.index_version = ""
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Матрица нормированных эмбеддингов; занятые строки отмечены в _slot_keys
+        self._matrix: Optional[np.ndarray] = None
+        self._slot_keys = np.full(max(max_entries, 0), -1, dtype=np.int64)
+        self._free_slots = list(range(max(max_entries, 0) - 1, -1, -1))
+
+        self._dirty = False
+        self._save_lock = threading.Lock()
+        self._stop_saving = threading.Event()
+        self._saver: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, query_embedding: list) -> Optional[dict]:
+        """Ищет ответ на семантически близкий запрос."""
+        if not self.enabled:
+            return None
+
+        query = _normalize(query_embedding)
+        with self._lock:
+            self._evict_expired()
+            if self._entries:
+                scores = self._matrix @ query
+                scores[self._slot_keys < 0] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key = int(self._slot_keys[best])
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]["response"]
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding: list, response: dict) -> None:
+        """Сохраняет ответ для запроса, вытесняя самые старые записи."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._add(_normalize(query_embedding), response, time.time())
+            self._dirty = True
+
+    def sync_index_version(self, index_version: str) -> None:
+        """Сбрасывает кэш, если векторный индекс был пересобран."""
+        if index_version == self.index_version:
+            return
+        with self._lock:
+            if self._entries:
+                print(
+                    f"[AnswerCache] Index version changed ({self.index_version!r} -> {index_version!r}), clearing cache."
+                )
+            self._clear()
+            self.index_version = index_version
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+            self._dirty = True
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def load(self) -> None:
+        """Загружает кэш с диска, если задан файл и версия индекса совпадает."""
+        if not self.enabled or not self.persist_path:
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get("index_version") != self.index_version:
+            print("[AnswerCache] Persisted cache is for another index version, ignoring.")
+            return
+
+        now = time.time()
+        with self._lock:
+            for entry in data.get("entries", []):
+                if now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                self._add(
+                    np.asarray(entry["embedding"], dtype=np.float32),
+                    entry["response"],
+                    entry["created_at"],
+                )
+        print(f"[AnswerCache] Loaded {len(self._entries)} entries from {self.persist_path}")
+
+    def start_persistence(self) -> None:
+        """Запускает фоновое сохранение на диск раз в save_interval секунд."""
+        if not self.enabled or not self.persist_path or self.save_interval <= 0:
+            return
+        if self._saver is not None:
+            return
+        self._saver = threading.Thread(
+            target=self._save_periodically, name="answer-cache-saver", daemon=True
+        )
+        self._saver.start()
+
+    def close(self) -> None:
+        """Останавливает фоновое сохранение и сохраняет несохраненные изменения."""
+        self._stop_saving.set()
+        if self._saver is not None:
+            self._saver.join()
+            self._saver = None
+        self.save()
+
+    def save(self) -> None:
+        """Сохраняет кэш на диск, если с прошлого сохранения он изменился."""
+        if not self.persist_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                # Под блокировкой только снимок; сериализация и запись — без нее
+                index_version = self.index_version
+                # Строки матрицы переиспользуются, поэтому эмбеддинги копируются
+                entries = [
+                    {**entry, "embedding": entry["embedding"].copy()}
+                    for entry in self._entries.values()
+                ]
+                self._dirty = False
+            try:
+                self._write(index_version, entries)
+            except OSError as e:
+                print(f"[AnswerCache] Failed to save cache to {self.persist_path}: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def _save_periodically(self) -> None:
+        while not self._stop_saving.wait(self.save_interval):
+            self.save()
+
+    def _add(self, embedding: np.ndarray, response: dict, created_at: float) -> None:
+        # Вызывается под self._lock
+        if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+            self._clear()
+            self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+        if not self._free_slots:
+            self._remove(next(iter(self._entries)))
+        slot = self._free_slots.pop()
+        key = self._next_id
+        self._next_id += 1
+        self._matrix[slot] = embedding
+        self._slot_keys[slot] = key
+        self._entries[key] = {
+            "embedding": self._matrix[slot],
+            "response": response,
+            "created_at": created_at,
+            "slot": slot,
+        }
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._slot_keys[entry["slot"]] = -1
+        self._free_slots.append(entry["slot"])
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._slot_keys[:] = -1
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry["created_at"] > self.ttl_seconds
+        ]
+        for key in expired:
+            self._remove(key)
+        if expired:
+            self._dirty = True
+
+    def _write(self, index_version: str, entries: list) -> None:
+        data = {
+            "index_version": index_version,
+            "entries": [
+                {
+                    "embedding": entry["embedding"].tolist(),
+                    "response": entry["response"],
+                    "created_at": entry["created_at"],
+                }
+                for entry in entries
+            ],
+        }
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        # Свое временное имя у каждой записи: воркеры с общим ANSWER_CACHE_PATH
+        # не должны писать в один файл и подменять чужой недописанный
+        tmp_path = f"{self.persist_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def _normalize(embedding: list) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
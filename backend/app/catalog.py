@@ -0,0 +1,319 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+
+from .metrics import CATALOG_ANSWERS
+
+# SQLite-каталог программ и дисциплин, который собирает data_collector/parser.py
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/catalog.sqlite3")
+# Сколько дисциплин перечислять в одном ответе
+CATALOG_MAX_LIST_ITEMS = int(os.getenv("CATALOG_MAX_LIST_ITEMS", "50"))
+
+_QUOTED_RE = re.compile(r"[«\"“']([^«»\"“”']{3,})[»\"”']")
+_SEMESTER_RES = (
+    re.compile(r"(\d+)\s*(?:-?\s*(?:й|м|ом|ой))?\s+семестр"),
+    re.compile(r"семестр\w*\s*(?:№\s*)?(\d+)"),
+)
+_ORDINAL_SEMESTER_RE = re.compile(r"(перв|втор|трет|четверт)\w*\s+семестр")
+_ORDINALS = {"перв": 1, "втор": 2, "трет": 3, "четверт": 4}
+
+_HOURS_RE = re.compile(r"сколько\s+(?:\w+\s+)?(?:час|зачетн|кредит|з\.?\s?е)|трудоемк")
+_SEMESTER_OF_COURSE_RE = re.compile(r"в\s+как\w+\s+семестр|когда\s+(?:\w+\s+)?(?:изуча|прохо|чита|буд)")
+_LIST_RE = re.compile(r"\b(?:какие|список|перечисл\w*|покажи|назови)\b")
+_COURSES_RE = re.compile(r"дисциплин|курс|предмет|электив|практик")
+# Каталог не различает обязательные и выборные дисциплины — такие вопросы идут в RAG
+_ELECTIVES_RE = re.compile(r"по\s+выбору|электив|выборн")
+# Вопросы о себе ("мне", "я аналитик") — за персональной рекомендацией, а не за фактом
+_PERSONAL_RE = re.compile(r"\b(?:я|мне|меня|мной|мой|моя|мое|мои|моего|моей|моих|моим)\b")
+# Практики (блок учебного плана), но не практикумы
+_PRACTICE_RE = re.compile(r"\bпрактик(?:а|и|у|ой|ах|ам)?\b")
+# Вопросы о смысле и пользе дисциплин — открытые, их оставляем LLM
+_OPEN_ENDED_RE = re.compile(r"\b(?:зачем|почему|чем|полез\w*|сложн\w*|лучше|интересн\w*|стоит)\b")
+# Служебные слова запроса списка. Если после них, программы и семестра в вопросе
+# остается что-то еще ("по машинному обучению", "на английском"), это тематический
+# вопрос: полный список программы на него не ответ, его оставляем RAG
+_LIST_FILLER_RE = re.compile(
+    r"\b(?:какие|список|перечисл\w*|покажи|назови|дисциплин\w*|курс\w*|предмет\w*"
+    r"|практик\w*|семестр\w*|программ\w*|учебн\w*|план\w*|магистратур\w*"
+    r"|есть|будут|бывают|изуча\w*|прохо\w*|чита\w*|вход\w*|относ\w*|включ\w*"
+    r"|все|всех|весь|там|в|во|на|к|и|а|у|из|для|\d+)\b"
+)
+
+
+def normalize_name(text: str) -> str:
+    """Ключ для сравнения названий (как в data_collector/catalog.py)."""
+    return " ".join(text.replace("ё", "е").replace("Ё", "Е").split()).casefold()
+
+
+class CourseCatalog:
+    """
+    Ответы на фактические вопросы из SQLite-каталога без поиска и LLM:
+    трудоемкость дисциплины, семестр дисциплины, список дисциплин
+    программы / семестра / блока практик. Если вопрос не похож ни на один
+    из этих шаблонов, answer возвращает None и запрос идет в RAG.
+    Каталог переоткрывается, если сборщик подменил файл.
+    """
+
+    def __init__(self, db_path: str = CATALOG_PATH, max_list_items: int = CATALOG_MAX_LIST_ITEMS):
+        self.db_path = db_path
+        self.max_list_items = max_list_items
+        self.answers: "dict[str, int]" = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._signature = None
+        self._programs: list = []
+        self._course_keys: List[str] = []
+
+    def answer(self, query: str) -> Optional[dict]:
+        with self._lock:
+            if not self._refresh():
+                return None
+            q = normalize_name(query)
+            intent, result = self._answer(q)
+        if result is not None:
+            self.answers[intent] = self.answers.get(intent, 0) + 1
+            CATALOG_ANSWERS.labels(intent).inc()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "available": self._conn is not None,
+            "programs": len(self._programs),
+            "course_names": len(self._course_keys),
+            "answers": dict(self.answers),
+        }
+
+    def _answer(self, q: str) -> tuple:
+        if _PERSONAL_RE.search(q):
+            return None, None
+        program_ids = self._match_programs(q)
+        course_keys = self._match_courses(q)
+
+        if course_keys and _HOURS_RE.search(q):
+            rows = self._course_rows(course_keys, program_ids)
+            if rows:
+                return "hours", self._hours_response(rows)
+        if course_keys and _SEMESTER_OF_COURSE_RE.search(q):
+            rows = self._course_rows(course_keys, program_ids)
+            if rows:
+                return "semester", self._semesters_response(rows)
+
+        if (
+            _LIST_RE.search(q)
+            and _COURSES_RE.search(q)
+            and not _OPEN_ENDED_RE.search(q)
+            and not _ELECTIVES_RE.search(q)
+        ):
+            semester = _match_semester(q)
+            if semester is None and not program_ids:
+                return None, None
+            if _has_topic_words(self._strip_programs(q)):
+                return None, None
+            practice_only = _PRACTICE_RE.search(q) is not None
+            rows = self._list_rows(program_ids, semester, practice_only)
+            if rows:
+                return "list", self._list_response(rows, semester)
+        return None, None
+
+    def _match_programs(self, q: str) -> List[int]:
+        """Программы, упомянутые в вопросе (по названию, слагу URL или аббревиатуре)."""
+        return sorted({program_id for _, _, program_id in self._program_mentions(q)})
+
+    def _program_mentions(self, q: str) -> list:
+        """Упоминания программ в вопросе: (начало, конец, id программы)."""
+        matches = []
+        for program_id, aliases in self._programs:
+            for alias in aliases:
+                for match in re.finditer(rf"(?<!\w){re.escape(alias)}(?!\w)", q):
+                    matches.append((match.start(), match.end(), program_id))
+        # "ai" внутри "ai product" — не отдельное упоминание
+        return [
+            (start, end, program_id)
+            for start, end, program_id in matches
+            if not any(s <= start and end <= e and (e - s) > (end - start) for s, e, _ in matches)
+        ]
+
+    def _strip_programs(self, q: str) -> str:
+        for start, end, _ in sorted(self._program_mentions(q), reverse=True):
+            q = q[:start] + " " + q[end:]
+        return q
+
+    def _match_courses(self, q: str) -> List[str]:
+        quoted = [normalize_name(text) for text in _QUOTED_RE.findall(q)]
+        if quoted:
+            # Точное совпадение с названием в кавычках, иначе — названия, содержащие его
+            found = [key for key in self._course_keys if key in quoted] or [
+                key for key in self._course_keys if any(text in key for text in quoted)
+            ]
+            if found:
+                return found
+        # Самое длинное название, целиком входящее в вопрос
+        found = [
+            key
+            for key in self._course_keys
+            if key in q and re.search(rf"(?<!\w){re.escape(key)}(?!\w)", q)
+        ]
+        if not found:
+            return []
+        longest = max(len(key) for key in found)
+        return [key for key in found if len(key) == longest]
+
+    def _course_rows(self, course_keys: List[str], program_ids: List[int]) -> list:
+        sql = (
+            "SELECT c.name, c.block, c.semester, c.hours, c.credits, p.title, p.url"
+            " FROM courses c JOIN programs p ON p.id = c.program_id"
+            f" WHERE c.name_key IN ({', '.join('?' * len(course_keys))})"
+        )
+        params = list(course_keys)
+        if program_ids:
+            sql += f" AND c.program_id IN ({', '.join('?' * len(program_ids))})"
+            params += program_ids
+        sql += " ORDER BY p.id, c.semester, c.id"
+        return self._conn.execute(sql, params).fetchall()
+
+    def _list_rows(
+        self, program_ids: List[int], semester: Optional[int], practice_only: bool
+    ) -> list:
+        sql = (
+            "SELECT c.name, c.block, c.semester, c.hours, c.credits, p.title, p.url"
+            " FROM courses c JOIN programs p ON p.id = c.program_id WHERE 1 = 1"
+        )
+        params: list = []
+        if program_ids:
+            sql += f" AND c.program_id IN ({', '.join('?' * len(program_ids))})"
+            params += program_ids
+        if semester is not None:
+            sql += " AND c.semester = ?"
+            params.append(semester)
+        if practice_only:
+            sql += " AND c.block LIKE '%рактик%'"
+        sql += " ORDER BY p.id, c.semester, c.id"
+        return self._conn.execute(sql, params).fetchall()
+
+    def _hours_response(self, rows: list) -> dict:
+        lines = [
+            f"- {name} ({title}, {semester} семестр): "
+            f"{_amount(hours, 'ч')}, {_amount(credits, 'з.е.')}"
+            for name, _, semester, hours, credits, title, _ in rows
+        ]
+        return _response("Трудоемкость по учебному плану:\n" + "\n".join(lines), rows)
+
+    def _semesters_response(self, rows: list) -> dict:
+        lines = [
+            f"- {name} ({title}): {semester} семестр"
+            for name, _, semester, _, _, title, _ in rows
+        ]
+        return _response("По учебному плану:\n" + "\n".join(lines), rows)
+
+    def _list_response(self, rows: list, semester: Optional[int]) -> dict:
+        shown = rows[: self.max_list_items]
+        parts = []
+        current = None
+        for name, block, course_semester, hours, credits, title, _ in shown:
+            group = (title, course_semester)
+            if group != current:
+                current = group
+                parts.append(f"\n{title}, {course_semester} семестр:")
+            parts.append(f"- {name} ({_amount(hours, 'ч')}, {_amount(credits, 'з.е.')})")
+        if len(rows) > len(shown):
+            parts.append(f"…и еще {len(rows) - len(shown)}")
+        header = "Дисциплины по учебному плану"
+        if semester is not None:
+            header += f" ({semester} семестр)"
+        return _response(header + ":\n" + "\n".join(parts).strip(), shown)
+
+    def _refresh(self) -> bool:
+        """Открывает каталог или переоткрывает его после пересборки. False — каталога нет."""
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            self._close()
+            return False
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature and self._conn is not None:
+            return True
+
+        self._close()
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        programs = conn.execute("SELECT id, title, url FROM programs ORDER BY id").fetchall()
+        self._programs = [
+            (program_id, _program_aliases(title, url)) for program_id, title, url in programs
+        ]
+        self._course_keys = [
+            key for (key,) in conn.execute("SELECT DISTINCT name_key FROM courses")
+        ]
+        self._conn = conn
+        self._signature = signature
+        print(
+            f"[Catalog] Loaded {len(programs)} programs, "
+            f"{len(self._course_keys)} course names from {self.db_path}"
+        )
+        return True
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._signature = None
+
+
+def _program_aliases(title: str, url: str) -> List[str]:
+    """Как программу могут назвать в вопросе: название, слаг URL, аббревиатура."""
+    aliases = [normalize_name(title)]
+    slug = url.rstrip("/").rsplit("/", 1)[-1]
+    if slug:
+        aliases.append(normalize_name(slug.replace("_", " ").replace("-", " ")))
+    words = re.findall(r"\w+", normalize_name(title))
+    if len(words) > 1:
+        aliases.append("".join(word[0] for word in words))
+    return aliases
+
+
+def _match_semester(q: str) -> Optional[int]:
+    for pattern in _SEMESTER_RES:
+        match = pattern.search(q)
+        if match:
+            return int(match.group(1))
+    match = _ORDINAL_SEMESTER_RE.search(q)
+    if match:
+        return _ORDINALS[match.group(1)]
+    return None
+
+
+def _has_topic_words(q: str) -> bool:
+    """Остались ли в вопросе слова сверх запроса списка, программы и семестра."""
+    for pattern in (*_SEMESTER_RES, _ORDINAL_SEMESTER_RE):
+        # Вместе с окончанием: "первом семестре", "семестра 2"
+        q = re.sub(pattern.pattern + r"\w*", " ", q)
+    return bool(re.search(r"\w", _LIST_FILLER_RE.sub(" ", q)))
+
+
+def _amount(value: Optional[int], unit: str) -> str:
+    return f"{value} {unit}" if value is not None else f"? {unit}"
+
+
+def _response(answer: str, rows: list) -> dict:
+    return {
+        "answer": answer,
+        "source_documents": [
+            {
+                "id": None,
+                "page_content": (
+                    f"Дисциплина: {name}. Семестр: {semester}. Программа: {title}. "
+                    f"Блок: {block}. Трудоемкость: {_amount(hours, 'ч')}, {_amount(credits, 'з.е.')}"
+                ),
+                "metadata": {
+                    "source": url,
+                    "type": "course_info",
+                    "program_title": title,
+                    "course_name": name,
+                    "semester": str(semester),
+                },
+            }
+            for name, block, semester, hours, credits, title, url in rows
+        ],
+    }
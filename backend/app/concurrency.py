@@ -0,0 +1,61 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "16"))
+MAX_QUEUED_CHATS = int(os.getenv("MAX_QUEUED_CHATS", "64"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+class OverloadedError(Exception):
+    """Сервис перегружен: очередь заполнена или ожидание слота истекло."""
+
+
+class AdmissionController:
+    """
+    Ограничивает число одновременных обращений к LLM.
+    Запросы сверх лимита ждут в очереди ограниченной длины,
+    а при переполнении очереди сразу получают отказ.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def acquire(self) -> None:
+        """Занимает слот обработки или бросает OverloadedError."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise OverloadedError("queue is full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise OverloadedError("timed out waiting for a slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занимает слот обработки на время выполнения блока."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+admission_controller = AdmissionController(
+    max_concurrency=MAX_CONCURRENT_CHATS,
+    max_queue=MAX_QUEUED_CHATS,
+    queue_timeout=QUEUE_TIMEOUT_SECONDS,
+)
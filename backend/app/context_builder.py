@@ -0,0 +1,127 @@
+import os
+import re
+import math
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+
+# Локальная cross-encoder модель для переранжирования кандидатов на CPU
+# (многоязычная: документы и вопросы на русском). Пустая строка — без
+# переранжирования, кандидаты остаются в порядке векторного поиска.
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+# Бюджеты контекста в токенах для QA и для списка дисциплин в рекомендациях
+QA_CONTEXT_TOKEN_BUDGET = int(os.getenv("QA_CONTEXT_TOKEN_BUDGET", "1200"))
+RECOMMENDATION_CONTEXT_TOKEN_BUDGET = int(
+    os.getenv("RECOMMENDATION_CONTEXT_TOKEN_BUDGET", "600")
+)
+# Порог сходства (Жаккар по словам), начиная с которого фрагменты считаются почти дубликатами.
+# Дисциплины сравниваются по названию, остальные документы — по тексту.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+# Токенизатор LLM недоступен локально; для русского текста BPE-токен
+# в среднем занимает около трех символов.
+CHARS_PER_TOKEN = 3.0
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов текста."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.casefold()))
+
+
+def _duplicate_key(doc: Document) -> frozenset:
+    # Карточки дисциплин построены по одному шаблону и отличаются в основном
+    # названием: сравнение всего текста склеивало бы разные дисциплины.
+    return _word_set(doc.metadata.get("course_name") or doc.page_content)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def create_reranker(model_name: Optional[str] = None):
+    """Загружает cross-encoder или возвращает None, если переранжирование отключено."""
+    model_name = RERANKER_MODEL if model_name is None else model_name
+    if not model_name:
+        return None
+    # Импорт здесь: sentence-transformers тянет torch, а без реранкера он не нужен
+    from sentence_transformers import CrossEncoder
+
+    print(f"[ContextBuilder] Loading reranker {model_name}")
+    return CrossEncoder(model_name, device="cpu")
+
+
+class ContextBuilder:
+    """
+    Сборка контекста между поиском и LLM:
+    переранжирует кандидатов cross-encoder'ом, отбрасывает почти дубликаты
+    и набирает лучшие фрагменты, пока не исчерпан бюджет токенов.
+    """
+
+    def __init__(self, reranker=None, near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.reranker = reranker
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+    def rerank(
+        self, query: str, docs: List[Document], render: Callable[[Document], str]
+    ) -> List[Document]:
+        """Сортирует документы по убыванию релевантности запросу."""
+        if self.reranker is None or len(docs) < 2:
+            return list(docs)
+        scores = self.reranker.predict(
+            [(query, render(doc)) for doc in docs],
+            batch_size=RERANKER_BATCH_SIZE,
+            show_progress_bar=False,
+        )
+        order = sorted(range(len(docs)), key=lambda i: -float(scores[i]))
+        return [docs[i] for i in order]
+
+    def pack(
+        self,
+        docs: List[Document],
+        token_budget: int,
+        max_docs: int,
+        render: Callable[[Document], str],
+    ) -> List[Document]:
+        """
+        Набирает документы в порядке docs, пропуская почти дубликаты уже
+        выбранных и те, что не помещаются в остаток бюджета. Первый документ
+        берется всегда, чтобы контекст не оказался пустым.
+        """
+        selected = []
+        selected_keys = []
+        used_tokens = 0
+        for doc in docs:
+            key = _duplicate_key(doc)
+            if any(
+                _jaccard(key, other) >= self.near_duplicate_threshold
+                for other in selected_keys
+            ):
+                continue
+            cost = estimate_tokens(render(doc))
+            if selected and used_tokens + cost > token_budget:
+                continue
+            selected.append(doc)
+            selected_keys.append(key)
+            used_tokens += cost
+            if len(selected) >= max_docs:
+                break
+        return selected
+
+    def build(
+        self,
+        query: str,
+        docs: List[Document],
+        token_budget: int,
+        max_docs: int,
+        render: Callable[[Document], str] = lambda doc: doc.page_content,
+    ) -> List[Document]:
+        return self.pack(self.rerank(query, docs, render), token_budget, max_docs, render)
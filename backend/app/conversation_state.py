@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "data/conversations.sqlite3")
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", str(30 * 24 * 3600)))
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", "100000"))
+
+# Как часто (в записях) SQLite-хранилище чистит устаревшие записи
+SQLITE_EVICTION_INTERVAL = 256
+
+
+class ConversationRecord(NamedTuple):
+    """Состояние диалога с одним чатом."""
+
+    awaiting_background: bool = False
+    background: Optional[str] = None
+    updated_at: float = 0.0
+
+
+class InMemoryConversationStore:
+    """Состояния диалогов в памяти процесса: LRU с ограничением размера и TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._records: "OrderedDict[str, ConversationRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: str) -> Optional[ConversationRecord]:
+        with self._lock:
+            record = self._records.get(chat_id)
+            if record is None:
+                return None
+            if time.time() - record.updated_at > self.ttl_seconds:
+                del self._records[chat_id]
+                return None
+            self._records.move_to_end(chat_id)
+            return record
+
+    def set(self, chat_id: str, record: ConversationRecord) -> None:
+        with self._lock:
+            self._records[chat_id] = record._replace(updated_at=time.time())
+            self._records.move_to_end(chat_id)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+
+    async def aget(self, chat_id: str) -> Optional[ConversationRecord]:
+        return self.get(chat_id)
+
+    async def aset(self, chat_id: str, record: ConversationRecord) -> None:
+        self.set(chat_id, record)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "entries": len(self._records)}
+
+
+class SQLiteConversationStore:
+    """
+    Состояния диалогов в SQLite в режиме WAL: несколько воркеров uvicorn
+    на одном хосте видят общее состояние без отдельного сетевого сервиса.
+    Соединения открываются лениво, отдельно в каждом потоке и процессе:
+    хранилище создается при импорте, до fork воркеров gunicorn --preload.
+    Из async-кода используются aget/aset, которые не блокируют event loop.
+    """
+
+    def __init__(self, db_path: str, max_entries: int, ttl_seconds: float):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+    def _init_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " chat_id TEXT PRIMARY KEY,"
+            " awaiting_background INTEGER NOT NULL,"
+            " background TEXT,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS conversations_updated_at"
+            " ON conversations (updated_at)"
+        )
+
+    def get(self, chat_id: str) -> Optional[ConversationRecord]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT awaiting_background, background, updated_at"
+                " FROM conversations WHERE chat_id = ? AND updated_at >= ?",
+                (chat_id, time.time() - self.ttl_seconds),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return ConversationRecord(bool(row[0]), row[1], row[2])
+
+    def set(self, chat_id: str, record: ConversationRecord) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations"
+            " (chat_id, awaiting_background, background, updated_at)"
+            " VALUES (?, ?, ?, ?)",
+            (chat_id, int(record.awaiting_background), record.background, time.time()),
+        )
+        self._writes += 1
+        if self._writes % SQLITE_EVICTION_INTERVAL == 0:
+            self._evict(conn)
+
+    async def aget(self, chat_id: str) -> Optional[ConversationRecord]:
+        # Запрос может ждать блокировку до 5 с (timeout соединения)
+        return await asyncio.to_thread(self.get, chat_id)
+
+    async def aset(self, chat_id: str, record: ConversationRecord) -> None:
+        await asyncio.to_thread(self.set, chat_id, record)
+
+    def stats(self) -> dict:
+        (count,) = self._connection().execute(
+            "SELECT COUNT(*) FROM conversations"
+        ).fetchone()
+        return {"backend": "sqlite", "entries": count}
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "DELETE FROM conversations WHERE updated_at < ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        conn.execute(
+            "DELETE FROM conversations WHERE chat_id IN ("
+            " SELECT chat_id FROM conversations ORDER BY updated_at DESC"
+            " LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: sqlite3.Connection не потокобезопасен.
+        # После fork поток-наследник видит соединение родителя в threading.local,
+        # поэтому рядом хранится pid, и в новом процессе соединение открывается заново.
+        pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # CREATE ... IF NOT EXISTS дешев, схема проверяется каждым новым соединением
+            self._init_schema(conn)
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+
+def create_conversation_store():
+    """Создает хранилище состояний диалогов согласно CONVERSATION_STORE."""
+    if CONVERSATION_STORE == "memory":
+        return InMemoryConversationStore(CONVERSATION_MAX_ENTRIES, CONVERSATION_TTL_SECONDS)
+    if CONVERSATION_STORE == "sqlite":
+        return SQLiteConversationStore(
+            CONVERSATION_DB_PATH, CONVERSATION_MAX_ENTRIES, CONVERSATION_TTL_SECONDS
+        )
+    raise ValueError(
+        f"Unknown CONVERSATION_STORE {CONVERSATION_STORE!r}, expected 'memory' or 'sqlite'"
+    )
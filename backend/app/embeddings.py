@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+# Бэкенд модели эмбеддингов:
+# "torch"     — исходная модель sentence-transformers (FP32, PyTorch);
+# "onnx"      — та же модель, экспортированная в ONNX (onnxruntime);
+# "onnx-int8" — ONNX-модель с динамической int8-квантизацией.
+# Для ONNX-бэкендов нужен pip install "sentence-transformers[onnx]".
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Файл квантизованной модели внутри репозитория модели (или локальной папки)
+EMBEDDING_ONNX_INT8_FILE = os.getenv(
+    "EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx"
+)
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def embedding_model_kwargs(backend: str) -> dict:
+    """Параметры SentenceTransformer для выбранного бэкенда."""
+    if backend == "torch":
+        return {"device": "cpu"}
+    if backend == "onnx":
+        return {"device": "cpu", "backend": "onnx"}
+    if backend == "onnx-int8":
+        return {
+            "device": "cpu",
+            "backend": "onnx",
+            "model_kwargs": {"file_name": EMBEDDING_ONNX_INT8_FILE},
+        }
+    raise ValueError(
+        f"Unknown EMBEDDING_BACKEND {backend!r}, expected one of {EMBEDDING_BACKENDS}"
+    )
+
+
+def create_embedding_model(backend: Optional[str] = None) -> HuggingFaceEmbeddings:
+    """Создает модель эмбеддингов EMBEDDING_MODEL на выбранном бэкенде."""
+    backend = backend or EMBEDDING_BACKEND
+    print(f"[Embeddings] Loading {os.environ['EMBEDDING_MODEL']} with backend {backend!r}")
+    return HuggingFaceEmbeddings(
+        model_name=os.environ["EMBEDDING_MODEL"],
+        model_kwargs=embedding_model_kwargs(backend),
+    )
+
+
+def normalize_query_text(text: str) -> str:
+    """Нормализует текст запроса для использования в качестве ключа кэша."""
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingService:
+    """
+    Обертка над моделью эмбеддингов:
+    - мемоизирует эмбеддинги запросов в ограниченном LRU-кэше;
+    - собирает одновременные асинхронные запросы за короткое окно
+      в один батч и считает их одним вызовом embed_documents;
+    - ведет статистику размеров батчей и задержек.
+    """
+
+    def __init__(
+        self,
+        model,
+        executor,
+        cache_size: int,
+        batch_window_ms: float,
+        max_batch_size: int,
+    ):
+        self.model = model
+        self.executor = executor
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending: "dict[str, tuple[str, asyncio.Future]]" = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_observed_batch = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    def embed_query(self, text: str) -> list:
+        """Синхронный эмбеддинг запроса с использованием кэша."""
+        key = normalize_query_text(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        embedding = self.model.embed_query(" ".join(text.split()))
+        self._record_batch(1, time.perf_counter() - started)
+        self._cache_put(key, embedding)
+        return embedding
+
+    def embed_queries(self, texts: list) -> list:
+        """Эмбеддинги списка запросов: промахи кэша считаются одним батчем."""
+        keys = [normalize_query_text(text) for text in texts]
+        embeddings = [self._cache_get(key) for key in keys]
+
+        missing = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None and key not in missing:
+                missing[key] = " ".join(text.split())
+
+        if missing:
+            started = time.perf_counter()
+            computed = self.model.embed_documents(list(missing.values()))
+            self._record_batch(len(missing), time.perf_counter() - started)
+            for key, embedding in zip(missing, computed):
+                self._cache_put(key, embedding)
+            computed_by_key = dict(zip(missing, computed))
+            embeddings = [
+                embedding if embedding is not None else computed_by_key[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+        return embeddings
+
+    async def aembed_query(self, text: str) -> list:
+        """
+        Асинхронный эмбеддинг запроса. Одновременные запросы объединяются
+        в один батч, одинаковые тексты считаются один раз.
+        """
+        key = normalize_query_text(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is None:
+            future = loop.create_future()
+            self._pending[key] = (" ".join(text.split()), future)
+            if len(self._pending) >= self.max_batch_size:
+                self._start_flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._start_flush)
+        else:
+            future = pending[1]
+
+        # shield: отмена одного из ожидающих не должна отменять общий батч
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_observed_batch,
+            "avg_latency_ms": 1000 * self.total_latency / self.batches if self.batches else 0.0,
+            "last_latency_ms": 1000 * self.last_latency,
+        }
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.get_running_loop().create_task(self._flush(batch))
+
+    async def _flush(self, batch: dict) -> None:
+        keys = list(batch.keys())
+        texts = [batch[key][0] for key in keys]
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            embeddings = await loop.run_in_executor(
+                self.executor, self.model.embed_documents, texts
+            )
+        except Exception as e:
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record_batch(len(texts), time.perf_counter() - started)
+        for key, embedding in zip(keys, embeddings):
+            self._cache_put(key, embedding)
+            future = batch[key][1]
+            if not future.done():
+                future.set_result(embedding)
+
+    def _record_batch(self, size: int, latency: float) -> None:
+        self.batches += 1
+        self.batched_texts += size
+        self.max_observed_batch = max(self.max_observed_batch, size)
+        self.total_latency += latency
+        self.last_latency = latency
+
+    def _cache_get(self, key: str) -> Optional[list]:
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return embedding
+
+    def _cache_put(self, key: str, embedding: list) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,104 @@
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatLLM(BaseChatModel):
+    """
+    Детерминированная локальная замена ChatLLM7 для нагрузочных тестов:
+    отвечает после latency_ms и выдает answer_tokens токенов
+    со скоростью tokens_per_second. Текст ответа зависит только от промпта.
+    Для проверки устойчивости можно включить случайные сбои (failure_rate)
+    и медленные ответы (slow_rate с задержкой slow_latency_ms).
+    Как и ChatLLM7, реализует только синхронные _generate и _stream,
+    поэтому нагрузочный тест проходит тот же путь через пул потоков ResilientLLM.
+    """
+
+    latency_ms: float = 500.0
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+    failure_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency_ms: float = 10000.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-llm"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return [f"ответ{digest[i % len(digest)]}{i} " for i in range(self.answer_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _first_token_delay(self) -> float:
+        """Задержка до первого токена; бросает ошибку с вероятностью failure_rate."""
+        if random.random() < self.failure_rate:
+            raise RuntimeError("FakeChatLLM: simulated upstream failure")
+        if random.random() < self.slow_rate:
+            return self.slow_latency_ms / 1000
+        return self.latency_ms / 1000
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self._first_token_delay() + len(tokens) * self._token_delay())
+        message = AIMessage(content="".join(tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._first_token_delay())
+        for token in self._tokens(messages):
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class AsyncFakeChatLLM(FakeChatLLM):
+    """FakeChatLLM с нативными async-методами (для сравнения с синхронным путем)."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-llm-async"
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self._first_token_delay() + len(tokens) * self._token_delay())
+        message = AIMessage(content="".join(tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_token_delay())
+        for token in self._tokens(messages):
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
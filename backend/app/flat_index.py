@@ -0,0 +1,185 @@
+import json
+import uuid
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Поля метаданных, по которым поддерживаются фильтры (как filter в Chroma)
+FILTER_FIELDS = ("type", "program_title", "semester")
+
+VECTORS_FILENAME = "vectors.npy"
+DOCUMENTS_FILENAME = "documents.json"
+META_FILENAME = "meta.json"
+
+
+def _field_filename(field: str) -> str:
+    return f"field_{field}.npy"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def export_flat_index(vectordb, path: str) -> None:
+    """
+    Выгружает коллекцию Chroma в папку path: нормированную матрицу float32,
+    коды значений полей FILTER_FIELDS (int32, -1 — поля нет) и тексты с метаданными.
+    """
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    target = Path(path)
+    target.mkdir(parents=True)
+
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(0, 0)
+    np.save(target / VECTORS_FILENAME, _normalize(vectors))
+
+    metadatas = [metadata or {} for metadata in data["metadatas"]]
+    vocabularies = {}
+    for field in FILTER_FIELDS:
+        vocabulary = {}
+        codes = np.full(len(metadatas), -1, dtype=np.int32)
+        for i, metadata in enumerate(metadatas):
+            if field in metadata:
+                codes[i] = vocabulary.setdefault(str(metadata[field]), len(vocabulary))
+        np.save(target / _field_filename(field), codes)
+        vocabularies[field] = list(vocabulary)
+
+    documents = [
+        {"id": doc_id, "page_content": text, "metadata": metadata}
+        for doc_id, text, metadata in zip(data["ids"], data["documents"], metadatas)
+    ]
+    (target / DOCUMENTS_FILENAME).write_text(
+        json.dumps(documents, ensure_ascii=False), encoding="utf-8"
+    )
+    (target / META_FILENAME).write_text(
+        json.dumps({"count": len(documents), "vocabularies": vocabularies}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
+
+def load_or_export_flat_index(vectordb, index_dir: str, version: str) -> "FlatVectorIndex":
+    """
+    Открывает выгрузку коллекции для версии индекса version, а если ее нет —
+    выгружает коллекцию заново. Выгрузка пишется во временную папку
+    и переименовывается, поэтому воркеры, стартующие одновременно,
+    не видят недописанных файлов. Выгрузки других версий удаляются.
+    """
+    root = Path(index_dir)
+    target = root / version if version else None
+    if target is None or not (target / META_FILENAME).exists():
+        tmp = root / f".tmp-{uuid.uuid4().hex}"
+        export_flat_index(vectordb, str(tmp))
+        if target is None:
+            target = root / f"unversioned-{uuid.uuid4().hex}"
+        try:
+            tmp.rename(target)
+            print(f"[FlatIndex] Exported collection to {target}")
+        except OSError:
+            # Другой воркер успел выгрузить ту же версию
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        for stale in root.iterdir():
+            if stale != target and not stale.name.startswith(".tmp-"):
+                shutil.rmtree(stale, ignore_errors=True)
+    return FlatVectorIndex(str(target))
+
+
+class FlatVectorIndex:
+    """
+    Точный поиск ближайших соседей по выгрузке коллекции (см. export_flat_index).
+    Матрица и коды полей открываются через np.memmap, поэтому воркеры uvicorn
+    на одном хосте делят их через page cache. Top-k для пакета запросов —
+    одно матричное произведение; фильтр по метаданным — булева маска по кодам.
+    Сходство косинусное: для нормированных эмбеддингов порядок тот же, что у L2 в Chroma.
+    Интерфейс поиска совпадает с Chroma.similarity_search_by_vector.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.vectors = np.load(self.path / VECTORS_FILENAME, mmap_mode="r")
+        self.fields = {
+            field: np.load(self.path / _field_filename(field), mmap_mode="r")
+            for field in FILTER_FIELDS
+        }
+        meta = json.loads((self.path / META_FILENAME).read_text(encoding="utf-8"))
+        self.vocabularies = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in meta["vocabularies"].items()
+        }
+        self.documents = json.loads(
+            (self.path / DOCUMENTS_FILENAME).read_text(encoding="utf-8")
+        )
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def similarity_search_by_vector(
+        self, embedding: list, k: int = 4, filter: Optional[dict] = None
+    ) -> List[Document]:
+        return self.search_batch([embedding], k, filter)[0]
+
+    def search_batch(
+        self, query_embeddings: List[list], k: int, filter: Optional[dict] = None
+    ) -> List[List[Document]]:
+        """Top-k документов для каждого запроса, по убыванию сходства."""
+        if not len(self.documents):
+            return [[] for _ in query_embeddings]
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        rows = None
+        matrix = self.vectors
+        if filter:
+            rows = np.flatnonzero(self._mask(filter))
+            matrix = self.vectors[rows]
+
+        k = min(k, matrix.shape[0])
+        if k == 0:
+            return [[] for _ in query_embeddings]
+        scores = queries @ matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return [[self._document(i) for i in row] for row in top]
+
+    def _mask(self, filter: dict) -> np.ndarray:
+        """Маска строк для фильтра: {"поле": значение}, {"поле": {"$eq"|"$in": ...}}, {"$and": [...]}."""
+        mask = np.ones(len(self.documents), dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for part in condition:
+                    mask &= self._mask(part)
+                continue
+            if key not in self.fields:
+                raise ValueError(f"Flat index cannot filter by {key!r}")
+            if isinstance(condition, dict):
+                (operator, value), = condition.items()
+                if operator == "$eq":
+                    values = [value]
+                elif operator == "$in":
+                    values = value
+                else:
+                    raise ValueError(f"Unsupported filter operator {operator!r}")
+            else:
+                values = [condition]
+            codes = [
+                self.vocabularies[key][str(value)]
+                for value in values
+                if str(value) in self.vocabularies[key]
+            ]
+            mask &= np.isin(self.fields[key], codes)
+        return mask
+
+    def _document(self, row: int) -> Document:
+        document = self.documents[row]
+        return Document(
+            id=document["id"],
+            page_content=document["page_content"],
+            metadata=dict(document["metadata"]),
+        )
@@ -0,0 +1,318 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from .metrics import LLM_CALLS, LLM_HEDGES
+
+# Крайний срок одного обращения к LLM (включая ожидание слота и повторный запрос)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+# Глобальный лимит одновременных обращений к LLM на процесс
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Потоки для синхронных моделей (у ChatLLM7 нет async-методов). Запас сверх
+# LLM_MAX_CONCURRENCY нужен hedged-запросам и вызовам, брошенным по крайнему сроку:
+# они держат поток, пока не завершится HTTP-запрос.
+LLM_THREADS = int(os.getenv("LLM_THREADS", str(2 * LLM_MAX_CONCURRENCY)))
+# Повторный (hedged) запрос, если первый не ответил за квантиль LLM_HEDGE_QUANTILE
+# от недавних задержек; квантиль считается после LLM_HEDGE_MIN_SAMPLES ответов.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Circuit breaker: после стольких ошибок подряд обращения к LLM не выполняются
+# LLM_BREAKER_RESET_SECONDS секунд, затем пропускается один пробный запрос.
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Сколько последних задержек хранится для расчета квантиля
+LATENCY_WINDOW = 200
+
+
+class LLMUnavailable(Exception):
+    """LLM не ответила вовремя, вернула ошибку или отключена circuit breaker'ом."""
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных ответов."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Классический circuit breaker: closed -> open после failure_threshold
+    ошибок подряд, open -> half-open через reset_seconds (пропускается
+    один пробный запрос), half-open -> closed при успехе пробного запроса.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # Из open — в half-open; если пробный запрос так и не завершился
+            # (например, был отменен), через reset_seconds пропускается новый
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_seconds:
+                self.state = "half-open"
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[LLMClient] Circuit opened after {self.consecutive_failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class ResilientLLM:
+    """
+    Обертка над чат-моделью (ChatLLM7 или FakeChatLLM) с контролем хвостовых задержек:
+    крайний срок на вызов, hedged-запросы, глобальный лимит параллелизма
+    и circuit breaker. Все сбои приводятся к LLMUnavailable, чтобы RAGCore
+    мог ответить в деградированном режиме. Возвращает текст ответа.
+
+    Модели без нативных async-методов вызываются синхронно в собственном пуле
+    из threads потоков. Иначе LangChain выполнял бы их в пуле event loop по умолчанию
+    (min(32, cpu + 4) потоков, общий с asyncio.to_thread), и реальный параллелизм
+    определял бы он, а не max_concurrency.
+    """
+
+    def __init__(
+        self,
+        llm,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        hedge: bool = LLM_HEDGE,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        breaker: Optional[CircuitBreaker] = None,
+        threads: int = LLM_THREADS,
+    ):
+        self.llm = llm
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(
+            LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SECONDS
+        )
+        self.latencies = LatencyTracker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        llm_class = type(llm)
+        self._native_ainvoke = llm_class._agenerate is not BaseChatModel._agenerate
+        self._native_astream = llm_class._astream is not BaseChatModel._astream
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if not (self._native_ainvoke and self._native_astream):
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(threads, max_concurrency), thread_name_prefix="llm"
+            )
+
+    def invoke(self, prompt) -> str:
+        """
+        Синхронный вызов для скриптов: только circuit breaker, крайний срок
+        обеспечивает таймаут HTTP-клиента самой модели.
+        """
+        self._check_breaker()
+        started = time.perf_counter()
+        try:
+            content = self.llm.invoke(prompt).content
+        except Exception as e:
+            self._record_failure("error")
+            raise LLMUnavailable(str(e)) from e
+        self._record_success(time.perf_counter() - started)
+        return content
+
+    async def ainvoke(self, prompt) -> str:
+        self._check_breaker()
+        try:
+            content, latency = await asyncio.wait_for(self._hedged(prompt), self.timeout)
+        except asyncio.TimeoutError:
+            self._record_failure("timeout")
+            raise LLMUnavailable(f"LLM did not answer in {self.timeout:.0f}s")
+        except Exception as e:
+            self._record_failure("error")
+            raise LLMUnavailable(str(e)) from e
+        self._record_success(latency)
+        return content
+
+    async def astream(self, prompt) -> AsyncIterator[str]:
+        """
+        Потоковый вызов с общим крайним сроком. Hedging не применяется:
+        после первых токенов переключиться на другой запрос уже нельзя.
+        """
+        self._check_breaker()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        started = time.perf_counter()
+        async with self._slot():
+            stream = self._chunks(prompt).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            stream.__anext__(), max(0.0, deadline - loop.time())
+                        )
+                    except StopAsyncIteration:
+                        break
+                    yield chunk.content
+            except asyncio.TimeoutError:
+                self._record_failure("timeout")
+                raise LLMUnavailable(f"LLM did not answer in {self.timeout:.0f}s")
+            except Exception as e:
+                self._record_failure("error")
+                raise LLMUnavailable(str(e)) from e
+            finally:
+                await stream.aclose()
+        self._record_success(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        p95 = self.latencies.quantile(self.hedge_quantile, 1)
+        return {
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "in_flight": self.in_flight,
+            "hedge_delay_ms": 1000 * p95 if p95 is not None else None,
+        }
+
+    async def _hedged(self, prompt) -> tuple:
+        """Основной запрос и, если он задерживается дольше квантиля, повторный."""
+        first = asyncio.ensure_future(self._call(prompt))
+        tasks = {first}
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is None:
+                return await first
+
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            # Повторный запрос не отправляется, если лимит параллелизма исчерпан:
+            # при общей перегрузке он только добавил бы нагрузки
+            if not done and not self._semaphore.locked():
+                LLM_HEDGES.inc()
+                tasks.add(asyncio.ensure_future(self._call(prompt)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call(self, prompt) -> tuple:
+        async with self._slot():
+            started = time.perf_counter()
+            if self._native_ainvoke:
+                message = await self.llm.ainvoke(prompt)
+            else:
+                loop = asyncio.get_running_loop()
+                message = await loop.run_in_executor(self._executor, self.llm.invoke, prompt)
+            return message.content, time.perf_counter() - started
+
+    async def _chunks(self, prompt) -> AsyncIterator:
+        """Фрагменты ответа модели; синхронный stream читается в потоке пула."""
+        if self._native_astream:
+            async for chunk in self.llm.astream(prompt):
+                yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def put(item) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop уже закрыт: читать фрагменты некому
+                stopped.set()
+
+        def produce() -> None:
+            try:
+                for chunk in self.llm.stream(prompt):
+                    if stopped.is_set():
+                        return
+                    put((chunk, None))
+                put((None, None))
+            except Exception as e:
+                put((None, e))
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                chunk, error = await queue.get()
+                if error is not None:
+                    raise error
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            # Брошенный поток (крайний срок, отключение клиента) перестает читать ответ
+            stopped.set()
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Слот глобального лимита обращений к LLM."""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return self.latencies.quantile(self.hedge_quantile, self.hedge_min_samples)
+
+    def _check_breaker(self) -> None:
+        if not self.breaker.allow():
+            LLM_CALLS.labels("rejected").inc()
+            raise LLMUnavailable("circuit breaker is open")
+
+    def _record_success(self, latency: float) -> None:
+        LLM_CALLS.labels("ok").inc()
+        self.latencies.record(latency)
+        self.breaker.record_success()
+
+    def _record_failure(self, outcome: str) -> None:
+        LLM_CALLS.labels(outcome).inc()
+        self.breaker.record_failure()
+
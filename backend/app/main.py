@@ -1,16 +1,143 @@
-from fastapi import FastAPI, HTTPException
-from typing import Dict
+import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel
+from typing import AsyncIterator, List, Optional, Tuple
+
+from .schemas import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    BatchQueryResult,
+    QueryRequest,
+    QueryResponse,
+    SourcesMode,
+)
+from .rag_core import (
+    RAGCore,
+    RAGCoreNotReady,
+    get_rag_core,
+    init_rag_core,
+    preload_embedding_model,
+)
+from .catalog import CourseCatalog
+from .concurrency import admission_controller, OverloadedError
+from .conversation_state import ConversationRecord, create_conversation_store
+from .embeddings import normalize_query_text
+from .single_flight import SingleFlight
+from .metrics import (
+    HTTP_ERRORS,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    STREAM_ERRORS,
+    observe_stage,
+    register_stats_collector,
+)
+
+# Загрузить модель эмбеддингов при импорте приложения (в мастер-процессе
+# gunicorn --preload), чтобы воркеры разделяли веса copy-on-write.
+PRELOAD_EMBEDDING_MODEL = os.getenv("PRELOAD_EMBEDDING_MODEL", "0") == "1"
+# Длина текста источника в режиме sources="snippets"
+SOURCE_SNIPPET_CHARS = int(os.getenv("SOURCE_SNIPPET_CHARS", "300"))
+# Сжатие ответов: минимальный размер тела в байтах и уровень gzip (1-9)
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+# Потоковые ответы не сжимаются: компрессор буферизует мелкие фрагменты
+# и задерживал бы токены до конца генерации.
+UNCOMPRESSED_PATHS = ("/v1/chat/stream",)
+
+if PRELOAD_EMBEDDING_MODEL:
+    preload_embedding_model()
+
+# Ошибка инициализации RAGCore, если она случилась (для /ready)
+_init_error: Optional[str] = None
+
+
+async def _initialize_rag_core() -> None:
+    global _init_error
+    try:
+        await asyncio.to_thread(init_rag_core)
+    except Exception as e:
+        _init_error = str(e)
+        print(f"[main] RAGCore initialization failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Инициализация идет в фоне: liveness-проверка "/" отвечает сразу,
+    # а "/ready" — только после загрузки модели, открытия Chroma и прогрева.
+    init_task = asyncio.create_task(_initialize_rag_core())
+    yield
+    init_task.cancel()
+    try:
+        rag_core = get_rag_core()
+    except RAGCoreNotReady:
+        return
+    rag_core.stop_index_watcher()
+    # Несохраненные записи кэша ответов пишутся на диск при остановке
+    await asyncio.to_thread(rag_core.answer_cache.close)
 
-from .schemas import QueryRequest, QueryResponse
-from .rag_core import rag_core_instance
 
 app = FastAPI(
     title="ITMO Magistracy QA Bot API",
     description="API для чат-бота, помогающего абитуриентам ИТМО.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-CONVERSATION_STATE: Dict[str, Dict] = {}
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware, пропускающий без сжатия пути из uncompressed_paths."""
+
+    def __init__(self, app, uncompressed_paths=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.uncompressed_paths = frozenset(uncompressed_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.uncompressed_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    uncompressed_paths=UNCOMPRESSED_PATHS,
+    minimum_size=GZIP_MINIMUM_SIZE,
+    compresslevel=GZIP_COMPRESS_LEVEL,
+)
+
+conversation_store = create_conversation_store()
+# Объединение одновременных одинаковых запросов в одно вычисление RAGCore
+single_flight = SingleFlight()
+# Быстрые ответы на фактические вопросы из каталога дисциплин (без RAG и LLM)
+course_catalog = CourseCatalog()
+
+OVERLOADED_DETAIL = "Сервис сейчас перегружен. Пожалуйста, повторите запрос через несколько секунд."
+NOT_READY_DETAIL = "Сервис запускается. Пожалуйста, повторите запрос через несколько секунд."
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Считает запросы, их длительность и ошибки по шаблону пути эндпоинта."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.labels(endpoint, str(status)).inc()
+        HTTP_REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - started)
+        if status >= 500:
+            HTTP_ERRORS.labels(endpoint, str(status)).inc()
 
 
 @app.get("/", tags=["Health Check"])
@@ -19,46 +146,321 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready", tags=["Health Check"])
+def readiness_check():
+    """
+    Готовность к обработке запросов: модель загружена, индекс открыт и прогрет.
+    admission — текущая загрузка: занятые слоты (включая вопросы /v1/chat/batch) и очередь.
+    """
+    try:
+        get_rag_core()
+    except RAGCoreNotReady:
+        content = {"status": "error" if _init_error else "starting"}
+        if _init_error:
+            content["detail"] = _init_error
+        return JSONResponse(status_code=503, content=content)
+    return {"status": "ready", "admission": _admission_stats()}
+
+
+@app.get("/v1/stats", tags=["Health Check"])
+def service_stats():
+    """Счетчики кэшей и очереди запросов."""
+    rag_core = _rag_core_or_503()
+    return {
+        "answer_cache": rag_core.answer_cache.stats(),
+        "embeddings": rag_core.embedding_service.stats(),
+        "conversations": conversation_store.stats(),
+        "admission": _admission_stats(),
+        "llm": rag_core.llm_client.stats(),
+        "coalescing": single_flight.stats(),
+        "catalog": course_catalog.stats(),
+        "index": rag_core.index_stats(),
+    }
+
+
+@app.get("/metrics", tags=["Health Check"])
+def prometheus_metrics():
+    """Метрики в формате Prometheus: стадии RAG, HTTP-запросы, кэши, очередь."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/v1/chat", response_model=QueryResponse, tags=["Chat"])
 async def process_chat_query(request: QueryRequest):
     """
     Основной эндпоинт для обработки запросов от чат-бота.
     Реализует простую логику управления состоянием для получения рекомендаций.
     """
+    action, text = await _route_query(request)
+    if action == "reply":
+        return QueryResponse(answer=text)
+    if action == "qa":
+        result = _catalog_answer(text)
+        if result is not None:
+            return _json_response(
+                "catalog", QueryResponse(**_with_sources(result, request.sources))
+            )
+
+    rag_core = _rag_core_or_503()
+    operation = "recommendation" if action == "recommend" else "qa"
+
+    async def compute() -> dict:
+        async with admission_controller.slot():
+            if action == "recommend":
+                return await rag_core.aget_recommendations(
+                    text, request.program_title, request.semester
+                )
+            return await rag_core.aanswer_query(text)
+
+    try:
+        result = await single_flight.run(
+            _coalescing_key("chat", action, text, request), operation, compute
+        )
+        return _json_response(
+            operation, QueryResponse(**_with_sources(result, request.sources))
+        )
+    except OverloadedError:
+        raise _overloaded()
+    except Exception as e:
+        print(f"Error processing query: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Произошла внутренняя ошибка при обработке вашего запроса.",
+        )
+
+
+@app.post("/v1/chat/stream", tags=["Chat"])
+async def stream_chat_query(request: QueryRequest):
+    """
+    Потоковая версия /v1/chat. Отдает NDJSON-события:
+    {"type": "token", "content": ...} по мере генерации ответа,
+    затем {"type": "final", "answer": ..., "source_documents": [...]}.
+    """
+    action, text = await _route_query(request)
+    catalog_result = _catalog_answer(text) if action == "qa" else None
+    if action == "reply":
+        events = _single_answer_events(text)
+    elif catalog_result is not None:
+        events = _shaped_events(_result_events(catalog_result), request.sources)
+    else:
+        rag_core = _rag_core_or_503()
+        operation = "recommendation_stream" if action == "recommend" else "qa_stream"
+        key = _coalescing_key("stream", action, text, request)
+
+        def start_stream() -> AsyncIterator[dict]:
+            if action == "recommend":
+                stream = rag_core.astream_recommendations(
+                    text, request.program_title, request.semester
+                )
+            else:
+                stream = rag_core.astream_answer_query(text)
+            return _admitted_events(stream)
+
+        # Подписчики уже идущего потока слот не занимают
+        events = single_flight.join_stream(key, operation)
+        if events is None:
+            try:
+                await admission_controller.acquire()
+            except OverloadedError:
+                raise _overloaded()
+            events, started = single_flight.start_stream(key, operation, start_stream)
+            if not started:
+                admission_controller.release()
+        events = _shaped_events(events, request.sources)
+
+    return StreamingResponse(_ndjson(events), media_type="application/x-ndjson")
+
+
+@app.post("/v1/chat/batch", response_model=BatchQueryResponse, tags=["Chat"])
+async def process_chat_batch(request: BatchQueryRequest):
+    """
+    Пакетная обработка общих вопросов (без состояния диалога).
+    Ошибка по отдельному вопросу возвращается в поле error этого вопроса.
+    """
+    rag_core = _rag_core_or_503()
+    try:
+        # Слот admission control занимает каждый вызов LLM, а не пакет целиком:
+        # иначе пакет из сотен вопросов обходил бы лимит MAX_CONCURRENT_CHATS
+        results = await rag_core.aanswer_queries(
+            request.queries, llm_slot=admission_controller.slot
+        )
+    except Exception as e:
+        print(f"Error processing batch: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Произошла внутренняя ошибка при обработке вашего запроса.",
+        )
+    return _json_response(
+        "batch",
+        BatchQueryResponse(
+            results=[
+                BatchQueryResult(**_with_sources(r, request.sources)) for r in results
+            ]
+        ),
+    )
+
+
+async def _route_query(request: QueryRequest) -> Tuple[str, str]:
+    """
+    Определяет, что делать с запросом, с учетом состояния диалога.
+    Возвращает пару (действие, текст):
+    ("reply", готовый ответ), ("recommend", бэкграунд) или ("qa", вопрос).
+    """
     chat_id = request.chat_id
     query = request.query_text.lower()
+    conversation = await conversation_store.aget(chat_id)
 
     if (
         "посоветуй" in query
         or "порекомендуй" in query
         or "какие курсы выбрать" in query
     ):
-        if (
-            chat_id in CONVERSATION_STATE
-            and "background" in CONVERSATION_STATE[chat_id]
-        ):
-            user_background = CONVERSATION_STATE[chat_id]["background"]
-            result = rag_core_instance.get_recommendations(user_background)
-            return QueryResponse(**result)
+        if conversation is not None and conversation.background:
+            return "recommend", conversation.background
         else:
-            CONVERSATION_STATE[chat_id] = {"state": "awaiting_background"}
+            await conversation_store.aset(chat_id, ConversationRecord(awaiting_background=True))
             answer = "Конечно, я могу помочь с выбором курсов! Расскажите, пожалуйста, о своем опыте и знаниях. Например: 'Я python-разработчик с 2-летним опытом, хорошо знаю ML-фреймворки' или 'Я менеджер проектов без технического бэкграунда'."
-            return QueryResponse(answer=answer)
+            return "reply", answer
 
-    if (
-        chat_id in CONVERSATION_STATE
-        and CONVERSATION_STATE[chat_id].get("state") == "awaiting_background"
-    ):
-        CONVERSATION_STATE[chat_id] = {"background": request.query_text}
+    if conversation is not None and conversation.awaiting_background:
+        await conversation_store.aset(chat_id, ConversationRecord(background=request.query_text))
         answer = "Спасибо! Я сохранил информацию о вашем бэкграунде. Теперь можете снова попросить меня порекомендовать курсы."
-        return QueryResponse(answer=answer)
+        return "reply", answer
+
+    return "qa", request.query_text
+
+
+def _coalescing_key(kind: str, action: str, text: str, request: QueryRequest) -> tuple:
+    """Ключ объединения запросов: нормализованный вопрос или бэкграунд с фильтрами."""
+    if action == "recommend":
+        return (
+            kind,
+            action,
+            normalize_query_text(text),
+            request.program_title,
+            request.semester,
+        )
+    return (kind, action, normalize_query_text(text))
+
+
+async def _single_answer_events(answer: str) -> AsyncIterator[dict]:
+    yield {"type": "token", "content": answer}
+    yield {"type": "final", "answer": answer, "source_documents": []}
 
+
+async def _result_events(result: dict) -> AsyncIterator[dict]:
+    yield {"type": "token", "content": result["answer"]}
+    yield {"type": "final", **result}
+
+
+def _catalog_answer(text: str) -> Optional[dict]:
+    """Ответ на фактический вопрос из каталога дисциплин или None (вопрос идет в RAG)."""
+    with observe_stage("catalog", "lookup"):
+        return course_catalog.answer(text)
+
+
+async def _admitted_events(stream: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """Проксирует события RAGCore и освобождает слот по окончании потока."""
     try:
-        result = rag_core_instance.answer_query(request.query_text)
-        return QueryResponse(**result)
+        async for event in stream:
+            yield event
     except Exception as e:
-        print(f"Error processing query: {e}")
+        print(f"Error streaming query: {e}")
+        STREAM_ERRORS.inc()
+        yield {
+            "type": "error",
+            "detail": "Произошла внутренняя ошибка при обработке вашего запроса.",
+        }
+    finally:
+        admission_controller.release()
+
+
+async def _shaped_events(
+    events: AsyncIterator[dict], mode: SourcesMode
+) -> AsyncIterator[dict]:
+    """Применяет режим источников к завершающему событию потока."""
+    async for event in events:
+        if event["type"] == "final":
+            event = _with_sources(event, mode)
+        yield event
+
+
+async def _ndjson(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for event in events:
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def _with_sources(result: dict, mode: SourcesMode) -> dict:
+    """Копия ответа RAGCore с источниками в выбранном режиме (кэш не меняется)."""
+    if "source_documents" not in result:
+        return result
+    return {**result, "source_documents": _shape_sources(result["source_documents"], mode)}
+
+
+def _shape_sources(documents: Optional[List[dict]], mode: SourcesMode) -> Optional[List[dict]]:
+    if mode == "none" or documents is None:
+        return None
+    if mode == "full":
+        return documents
+    if mode == "metadata":
+        return [{"id": doc.get("id"), "metadata": doc["metadata"]} for doc in documents]
+    return [
+        {**doc, "page_content": _snippet(doc["page_content"])} for doc in documents
+    ]
+
+
+def _snippet(text: str) -> str:
+    if len(text) <= SOURCE_SNIPPET_CHARS:
+        return text
+    return text[:SOURCE_SNIPPET_CHARS].rstrip() + "…"
+
+
+def _json_response(operation: str, model: BaseModel) -> Response:
+    """
+    Сериализует ответ сразу в JSON, замеряя стадию serialization.
+    Пустые поля (source_documents при sources="none", page_content
+    при sources="metadata") в ответ не попадают.
+    """
+    with observe_stage(operation, "serialization"):
+        content = model.model_dump_json(exclude_none=True)
+    return Response(content=content, media_type="application/json")
+
+
+def _admission_stats() -> dict:
+    return {
+        "in_flight": admission_controller.in_flight,
+        "waiting": admission_controller.waiting,
+        "max_concurrency": admission_controller.max_concurrency,
+    }
+
+
+def _metrics_stats() -> dict:
+    """Данные для Prometheus-коллектора; секции RAGCore — только после готовности."""
+    stats = {"admission": _admission_stats()}
+    try:
+        rag_core = get_rag_core()
+    except RAGCoreNotReady:
+        return stats
+    stats["answer_cache"] = rag_core.answer_cache.stats()
+    stats["embeddings"] = rag_core.embedding_service.stats()
+    stats["llm"] = rag_core.llm_client.stats()
+    stats["index"] = rag_core.index_stats()
+    return stats
+
+
+register_stats_collector(_metrics_stats)
+
+
+def _rag_core_or_503() -> RAGCore:
+    try:
+        return get_rag_core()
+    except RAGCoreNotReady:
         raise HTTPException(
-            status_code=500,
-            detail="Произошла внутренняя ошибка при обработке вашего запроса.",
+            status_code=503, detail=NOT_READY_DETAIL, headers={"Retry-After": "5"}
         )
+
+
+def _overloaded() -> HTTPException:
+    """Быстрый отказ при переполнении очереди запросов."""
+    return HTTPException(
+        status_code=503, detail=OVERLOADED_DETAIL, headers={"Retry-After": "5"}
+    )
@@ -0,0 +1,148 @@
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Границы бакетов: от миллисекунд (кэш эмбеддингов) до десятков секунд (LLM)
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds",
+    "Длительность стадий обработки запроса в RAGCore",
+    ["operation", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Число HTTP-запросов",
+    ["endpoint", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса (для потоковых ответов — до отдачи заголовков)",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_ERRORS = Counter(
+    "http_errors_total",
+    "Число HTTP-ответов с кодом 5xx и необработанных исключений",
+    ["endpoint", "status"],
+)
+STREAM_ERRORS = Counter(
+    "rag_stream_errors_total",
+    "Ошибки, случившиеся после начала потокового ответа",
+)
+LLM_CALLS = Counter(
+    "rag_llm_calls_total",
+    "Обращения к LLM по исходу: ok, timeout, error, rejected (circuit breaker)",
+    ["outcome"],
+)
+LLM_HEDGES = Counter(
+    "rag_llm_hedged_requests_total",
+    "Повторные (hedged) запросы к LLM",
+)
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests_total",
+    "Запросы, получившие результат уже идущего одинакового вычисления",
+    ["operation"],
+)
+INDEX_SWAPS = Counter(
+    "rag_index_swaps_total",
+    "Переключения на новую версию векторного индекса: ok или error",
+    ["outcome"],
+)
+CATALOG_ANSWERS = Counter(
+    "rag_catalog_answers_total",
+    "Ответы из каталога дисциплин без поиска и LLM",
+    ["intent"],
+)
+DEGRADED_ANSWERS = Counter(
+    "rag_degraded_answers_total",
+    "Ответы без LLM (только найденные фрагменты)",
+    ["operation"],
+)
+
+
+def record_stage(operation: str, stage: str, seconds: float) -> None:
+    STAGE_DURATION.labels(operation, stage).observe(seconds)
+
+
+@contextmanager
+def observe_stage(operation: str, stage: str):
+    """Замеряет длительность блока как стадию stage операции operation."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(operation, stage, time.perf_counter() - started)
+
+
+class ServiceStatsCollector:
+    """
+    Отдает в Prometheus счетчики, которые уже ведут сами компоненты
+    (кэши, батчер эмбеддингов, очередь запросов), без дублирования учета.
+    stats_provider возвращает словарь в формате /v1/stats; секции RAGCore
+    в нем отсутствуют, пока RAGCore не готов.
+    """
+
+    def __init__(self, stats_provider: Callable[[], dict]):
+        self.stats_provider = stats_provider
+
+    def collect(self):
+        stats = self.stats_provider()
+        cache_events = CounterMetricFamily(
+            "rag_cache_requests", "Обращения к кэшам", labels=["cache", "result"]
+        )
+        if "answer_cache" in stats:
+            cache_events.add_metric(["answer", "hit"], stats["answer_cache"]["hits"])
+            cache_events.add_metric(["answer", "miss"], stats["answer_cache"]["misses"])
+        if "embeddings" in stats:
+            embeddings = stats["embeddings"]
+            cache_events.add_metric(["embedding", "hit"], embeddings["cache_hits"])
+            cache_events.add_metric(["embedding", "miss"], embeddings["cache_misses"])
+            yield CounterMetricFamily(
+                "rag_embedding_batches",
+                "Число вызовов модели эмбеддингов",
+                value=embeddings["batches"],
+            )
+        yield cache_events
+
+        if "index" in stats:
+            index_info = GaugeMetricFamily(
+                "rag_index_info", "Текущая версия векторного индекса", labels=["version", "backend"]
+            )
+            index_info.add_metric([stats["index"]["version"], stats["index"]["backend"]], 1)
+            yield index_info
+
+        if "llm" in stats:
+            llm = stats["llm"]
+            yield GaugeMetricFamily(
+                "rag_llm_circuit_open",
+                "1, если circuit breaker LLM разомкнут",
+                value=1 if llm["circuit_state"] == "open" else 0,
+            )
+            yield GaugeMetricFamily(
+                "rag_llm_in_flight",
+                "Активные обращения к LLM",
+                value=llm["in_flight"],
+            )
+
+        admission = stats["admission"]
+        yield GaugeMetricFamily(
+            "rag_in_flight_requests",
+            "Запросы, занявшие слот обработки",
+            value=admission["in_flight"],
+        )
+        yield GaugeMetricFamily(
+            "rag_queued_requests",
+            "Запросы, ожидающие слот обработки",
+            value=admission["waiting"],
+        )
+
+
+def register_stats_collector(stats_provider: Callable[[], dict]) -> None:
+    REGISTRY.register(ServiceStatsCollector(stats_provider))
@@ -1,88 +1,718 @@
 import os
+import gc
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncContextManager, AsyncIterator, Callable, List, Optional
 from dotenv import load_dotenv
 
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 from langchain_llm7 import ChatLLM7
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
 
 from .prompts import QA_PROMPT, RECOMMENDATION_PROMPT
+from .answer_cache import SemanticAnswerCache
+from .embeddings import EmbeddingService, create_embedding_model
+from .context_builder import (
+    QA_CONTEXT_TOKEN_BUDGET,
+    RECOMMENDATION_CONTEXT_TOKEN_BUDGET,
+    ContextBuilder,
+    create_reranker,
+)
+from .fake_llm import AsyncFakeChatLLM, FakeChatLLM
+from .llm_client import LLM_TIMEOUT_SECONDS, LLMUnavailable, ResilientLLM
+from .metrics import DEGRADED_ANSWERS, INDEX_SWAPS, observe_stage, record_stage
+from .vector_index import VectorIndex, open_vector_index, resolve_current_index
 
 load_dotenv()
 
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+QA_TOP_K = 8
+ELECTIVES_TOP_K = 30
+# Сколько кандидатов извлекать из индекса до переранжирования и упаковки контекста
+QA_CANDIDATES_K = int(os.getenv("QA_CANDIDATES_K", "24"))
+ELECTIVES_CANDIDATES_K = int(os.getenv("ELECTIVES_CANDIDATES_K", "60"))
+# Как часто проверять, не опубликовал ли индексер новую версию индекса (0 — не проверять)
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "5"))
+# Сколько вызовов LLM одновременно делает пакетная обработка вопросов
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+# Как часто фоновый поток сохраняет кэш ответов на диск (0 — только при остановке)
+ANSWER_CACHE_SAVE_SECONDS = float(os.getenv("ANSWER_CACHE_SAVE_SECONDS", "30"))
+
+
+WARMUP_QUERY = "Какие дисциплины есть в программе?"
+
+# Ответ без LLM, когда она недоступна: найденные фрагменты вместо сгенерированного текста
+DEGRADED_QA_ANSWER = (
+    "Сейчас я не могу сформулировать развернутый ответ. "
+    "Вот фрагменты из базы знаний, которые могут помочь:"
+)
+DEGRADED_RECOMMENDATION_ANSWER = (
+    "Сейчас я не могу подготовить персональную рекомендацию. "
+    "Вот дисциплины, которые ближе всего к вашему опыту:"
+)
+DEGRADED_SNIPPETS = 3
+DEGRADED_SNIPPET_CHARS = 300
+DEGRADED_COURSES = 5
+
+
+# "llm7" — ChatLLM7; "fake" — локальная FakeChatLLM для нагрузочных тестов
+LLM_BACKEND = os.getenv("LLM_BACKEND", "llm7")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "50"))
+# Сбои FakeChatLLM для проверки таймаутов, hedging и circuit breaker
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_SLOW_RATE = float(os.getenv("FAKE_LLM_SLOW_RATE", "0"))
+FAKE_LLM_SLOW_LATENCY_MS = float(os.getenv("FAKE_LLM_SLOW_LATENCY_MS", "10000"))
+# 1 — FakeChatLLM с нативными async-методами; по умолчанию только синхронные, как у ChatLLM7
+FAKE_LLM_NATIVE_ASYNC = os.getenv("FAKE_LLM_NATIVE_ASYNC", "0") == "1"
+
+
+def create_llm():
+    if LLM_BACKEND == "fake":
+        print(
+            f"[RAGCore] Using FakeChatLLM ({FAKE_LLM_LATENCY_MS} ms, {FAKE_LLM_TOKENS_PER_SEC} tok/s)"
+        )
+        fake_llm_class = AsyncFakeChatLLM if FAKE_LLM_NATIVE_ASYNC else FakeChatLLM
+        return fake_llm_class(
+            latency_ms=FAKE_LLM_LATENCY_MS,
+            tokens_per_second=FAKE_LLM_TOKENS_PER_SEC,
+            failure_rate=FAKE_LLM_FAILURE_RATE,
+            slow_rate=FAKE_LLM_SLOW_RATE,
+            slow_latency_ms=FAKE_LLM_SLOW_LATENCY_MS,
+        )
+    return ChatLLM7(
+        model=os.environ["LLM_MODEL_NAME"],
+        temperature=0.0,
+        # HTTP-таймаут ограничивает и брошенные по крайнему сроку запросы
+        timeout=math.ceil(LLM_TIMEOUT_SECONDS),
+    )
+
+
+class RAGCoreNotReady(Exception):
+    """RAGCore еще инициализируется."""
+
 
 class RAGCore:
-    def __init__(self):
+    def __init__(self, embedding_model: Optional[HuggingFaceEmbeddings] = None):
         print("[RAGCore] Initializing...")
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=os.environ["EMBEDDING_MODEL"], model_kwargs={"device": "cpu"}
+        # Пул потоков для CPU-bound работы (эмбеддинг запроса и поиск в Chroma),
+        # чтобы не блокировать event loop в асинхронных методах.
+        self.executor = ThreadPoolExecutor(
+            max_workers=EMBEDDING_WORKERS, thread_name_prefix="rag-embed"
+        )
+        self.embedding_model = embedding_model or create_embedding_model()
+        self.embedding_service = EmbeddingService(
+            self.embedding_model,
+            executor=self.executor,
+            cache_size=EMBEDDING_CACHE_SIZE,
+            batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+            max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
         )
 
-        self.vectordb = Chroma(
-            persist_directory=os.environ["VECTOR_DB_PATH"],
-            embedding_function=self.embedding_model,
+        self.vector_db_path = os.environ["VECTOR_DB_PATH"]
+        # Текущая версия индекса; подменяется целиком (см. refresh_index)
+        self.index = open_vector_index(
+            *resolve_current_index(self.vector_db_path), self.embedding_model
         )
+        self._index_lock = threading.Lock()
+        self.index_swaps = 0
+        self._failed_index_version: Optional[str] = None
+        self._stop_watching = threading.Event()
 
-        self.llm = ChatLLM7(
-            model=os.environ["LLM_MODEL_NAME"],
-            temperature=0.0,
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=ANSWER_CACHE_SIZE,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=ANSWER_CACHE_SIMILARITY,
+            persist_path=ANSWER_CACHE_PATH,
+            save_interval=ANSWER_CACHE_SAVE_SECONDS,
         )
+        self.answer_cache.index_version = self.index.version
+        self.answer_cache.load()
+        self.answer_cache.start_persistence()
+
+        self.context_builder = ContextBuilder(create_reranker())
+        self.llm = create_llm()
+        self.llm_client = ResilientLLM(self.llm)
+        print("[RAGCore] Initialized successfully.")
+
+    def warmup(self) -> None:
+        """Прогревает модель эмбеддингов и индекс тестовым запросом."""
+        started = time.perf_counter()
+        self._warm_index(self.index)
+        print(f"[RAGCore] Warmup finished in {time.perf_counter() - started:.2f}s.")
+
+    def _warm_index(self, index: VectorIndex) -> None:
+        query_embedding = self.embedding_model.embed_query(WARMUP_QUERY)
+        docs = index.retriever.similarity_search_by_vector(query_embedding, k=2)
+        self._select_qa_context(WARMUP_QUERY, docs)
+
+    def start_index_watcher(self) -> None:
+        """Фоновая проверка новых версий индекса раз в INDEX_POLL_SECONDS."""
+        if INDEX_POLL_SECONDS <= 0:
+            return
+        threading.Thread(target=self._watch_index, name="rag-index-watcher", daemon=True).start()
+
+    def stop_index_watcher(self) -> None:
+        self._stop_watching.set()
 
-        self.combine_docs_chain = create_stuff_documents_chain(self.llm, QA_PROMPT)
+    def _watch_index(self) -> None:
+        while not self._stop_watching.wait(INDEX_POLL_SECONDS):
+            self.refresh_index()
 
-        retriever = self.vectordb.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 8},
+    def refresh_index(self) -> bool:
+        """
+        Если индексер опубликовал новую версию, открывает и прогревает ее,
+        затем подменяет текущий индекс. Идущие запросы дорабатывают
+        со старой версией, новые получают новую. True — индекс подменен.
+        """
+        path, version = resolve_current_index(self.vector_db_path)
+        current = self.index
+        if (path, version) == (current.path, current.version):
+            return False
+        if version == self._failed_index_version:
+            return False
+
+        print(f"[RAGCore] New index version {version!r} found, loading...")
+        started = time.perf_counter()
+        index = None
+        try:
+            index = open_vector_index(path, version, self.embedding_model)
+            self._warm_index(index)
+        except Exception as e:
+            print(f"[RAGCore] Failed to load index version {version!r}: {e}")
+            if index is not None:
+                index.close()
+            self._failed_index_version = version
+            INDEX_SWAPS.labels("error").inc()
+            return False
+
+        with self._index_lock:
+            previous, self.index = self.index, index
+        self.answer_cache.sync_index_version(version)
+        self.index_swaps += 1
+        INDEX_SWAPS.labels("ok").inc()
+        print(
+            f"[RAGCore] Switched to index version {version!r} "
+            f"(loaded in {time.perf_counter() - started:.2f}s)."
         )
-        self.qa_chain = create_retrieval_chain(retriever, self.combine_docs_chain)
-        print("[RAGCore] Initialized successfully.")
+        # Старая версия закроется, когда ее отпустят идущие запросы
+        previous.retire()
+        return True
+
+    @contextmanager
+    def _use_index(self):
+        """Текущая версия индекса, которую не закроют до конца запроса."""
+        with self._index_lock:
+            index = self.index
+            index.acquire()
+        try:
+            yield index
+        finally:
+            index.release()
+
+    def index_stats(self) -> dict:
+        return {
+            "version": self.index.version,
+            "path": self.index.path,
+            "backend": "chroma" if self.index.flat_index is None else "flat",
+            "swaps": self.index_swaps,
+        }
 
     def answer_query(self, query: str) -> dict:
         """Отвечает на общий вопрос с использованием RAG."""
         print(f"[RAGCore] Answering general query: {query}")
-        result = self.qa_chain.invoke({"input": query})
-        return {
-            "answer": result["answer"],
-            "source_documents": [
-                {"page_content": doc.page_content, "metadata": doc.metadata}
-                for doc in result["context"]
-            ],
-        }
+        with self._use_index() as index:
+            with observe_stage("qa", "embedding"):
+                query_embedding = self.embedding_service.embed_query(query)
+            cached = self._lookup_cached_answer(query_embedding)
+            if cached is not None:
+                return cached
+
+            with observe_stage("qa", "retrieval"):
+                candidates = index.retriever.similarity_search_by_vector(
+                    query_embedding, k=QA_CANDIDATES_K
+                )
+            with observe_stage("qa", "context"):
+                docs = self._select_qa_context(query, candidates)
+            with observe_stage("qa", "prompt"):
+                prompt = self._qa_prompt(query, docs)
+            try:
+                with observe_stage("qa", "llm"):
+                    answer = self.llm_client.invoke(prompt)
+            except LLMUnavailable as e:
+                return self._degraded_qa_response("qa", index, docs, e)
+            response = self._build_response(answer, docs, index)
+            self._remember_answer(index, query_embedding, response)
+            return response
+
+    async def aanswer_query(self, query: str) -> dict:
+        """Асинхронная версия answer_query: не блокирует event loop."""
+        print(f"[RAGCore] Answering general query (async): {query}")
+        with self._use_index() as index:
+            with observe_stage("qa", "embedding"):
+                query_embedding = await self.embedding_service.aembed_query(query)
+            cached = self._lookup_cached_answer(query_embedding)
+            if cached is not None:
+                return cached
+
+            with observe_stage("qa", "retrieval"):
+                candidates = await self._run_in_executor(
+                    index.retriever.similarity_search_by_vector, query_embedding, QA_CANDIDATES_K
+                )
+            with observe_stage("qa", "context"):
+                docs = await self._run_in_executor(self._select_qa_context, query, candidates)
+            with observe_stage("qa", "prompt"):
+                prompt = self._qa_prompt(query, docs)
+            try:
+                with observe_stage("qa", "llm"):
+                    answer = await self.llm_client.ainvoke(prompt)
+            except LLMUnavailable as e:
+                return self._degraded_qa_response("qa", index, docs, e)
+            response = self._build_response(answer, docs, index)
+            self._remember_answer(index, query_embedding, response)
+            return response
+
+    async def astream_answer_query(self, query: str) -> AsyncIterator[dict]:
+        """
+        Потоковая версия answer_query. Отдает события {"type": "token"}
+        по мере генерации и завершающее {"type": "final"} с источниками.
+        """
+        print(f"[RAGCore] Streaming general query: {query}")
+        with self._use_index() as index:
+            with observe_stage("qa_stream", "embedding"):
+                query_embedding = await self.embedding_service.aembed_query(query)
+            cached = self._lookup_cached_answer(query_embedding)
+            if cached is not None:
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "final", **cached}
+                return
+
+            with observe_stage("qa_stream", "retrieval"):
+                candidates = await self._run_in_executor(
+                    index.retriever.similarity_search_by_vector, query_embedding, QA_CANDIDATES_K
+                )
+            with observe_stage("qa_stream", "context"):
+                docs = await self._run_in_executor(self._select_qa_context, query, candidates)
+            with observe_stage("qa_stream", "prompt"):
+                prompt = self._qa_prompt(query, docs)
+
+            chunks = []
+            try:
+                async for chunk in self._astream_llm("qa_stream", prompt):
+                    chunks.append(chunk)
+                    yield {"type": "token", "content": chunk}
+            except LLMUnavailable as e:
+                # Начатый ответ заменить уже нельзя — это ошибка потока
+                if chunks:
+                    raise
+                response = self._degraded_qa_response("qa_stream", index, docs, e)
+                yield {"type": "token", "content": response["answer"]}
+                yield {"type": "final", **response}
+                return
+
+            response = self._build_response("".join(chunks), docs, index)
+            self._remember_answer(index, query_embedding, response)
+            yield {"type": "final", **response}
+
+    def answer_queries(self, queries: List[str]) -> List[dict]:
+        """Синхронная обертка над aanswer_queries для скриптов (регрессия, FAQ)."""
+        return asyncio.run(self.aanswer_queries(queries))
+
+    async def aanswer_queries(
+        self,
+        queries: List[str],
+        llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+        llm_slot: Optional[Callable[[], AsyncContextManager]] = None,
+    ) -> List[dict]:
+        """
+        Отвечает на пакет вопросов: все запросы эмбеддятся одним батчем,
+        поиск в Chroma выполняется одним вызовом на весь пакет, а вызовы LLM
+        идут параллельно с ограничением llm_concurrency. Если задан llm_slot,
+        каждый вопрос занимает его на время сборки контекста и вызова LLM
+        (слот admission control, как у одиночного запроса к /v1/chat).
+        Результаты возвращаются в порядке вопросов; ошибка по одному вопросу
+        возвращается как {"error": ...} и не прерывает весь пакет.
+        """
+        print(f"[RAGCore] Answering batch of {len(queries)} queries")
+        if not queries:
+            return []
+        with self._use_index() as index:
 
-    def get_recommendations(self, user_background: str) -> dict:
-        """Генерирует персонализированные рекомендации по курсам."""
+            with observe_stage("batch", "embedding"):
+                embeddings = await self._run_in_executor(
+                    self.embedding_service.embed_queries, queries
+                )
+
+            results: List[Optional[dict]] = [None] * len(queries)
+            pending = []
+            for i, query_embedding in enumerate(embeddings):
+                cached = self._lookup_cached_answer(query_embedding)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    pending.append(i)
+
+            if pending:
+                with observe_stage("batch", "retrieval"):
+                    candidates_per_query = await self._run_in_executor(
+                        self._search_batch,
+                        index,
+                        [embeddings[i] for i in pending],
+                        QA_CANDIDATES_K,
+                    )
+                semaphore = asyncio.Semaphore(llm_concurrency)
+
+                async def answer_one(i: int, candidates: list) -> None:
+                    async with semaphore:
+                        try:
+                            async with llm_slot() if llm_slot is not None else nullcontext():
+                                with observe_stage("batch", "context"):
+                                    docs = await self._run_in_executor(
+                                        self._select_qa_context, queries[i], candidates
+                                    )
+                                with observe_stage("batch", "prompt"):
+                                    prompt = self._qa_prompt(queries[i], docs)
+                                with observe_stage("batch", "llm"):
+                                    answer = await self.llm_client.ainvoke(prompt)
+                        except LLMUnavailable as e:
+                            results[i] = self._degraded_qa_response("batch", index, docs, e)
+                            return
+                        except Exception as e:
+                            print(f"[RAGCore] Batch item {i} failed: {e}")
+                            results[i] = {"error": str(e)}
+                            return
+                    response = self._build_response(answer, docs, index)
+                    self._remember_answer(index, embeddings[i], response)
+                    results[i] = response
+
+                await asyncio.gather(
+                    *(
+                        answer_one(i, candidates)
+                        for i, candidates in zip(pending, candidates_per_query)
+                    )
+                )
+
+            return results
+
+    @staticmethod
+    def _search_batch(index: VectorIndex, query_embeddings: List[list], k: int) -> List[list]:
+        """Поиск ближайших документов для нескольких запросов одним вызовом индекса."""
+        if index.flat_index is not None:
+            return index.flat_index.search_batch(query_embeddings, k)
+        # У обертки LangChain нет пакетного поиска, поэтому обращаемся к коллекции
+        result = index.vectordb._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            include=["documents", "metadatas"],
+        )
+        return [
+            [
+                Document(id=doc_id, page_content=text, metadata=metadata or {})
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            for ids, texts, metadatas in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        ]
+
+    def _lookup_cached_answer(self, query_embedding: list):
+        # Кэш сбрасывается при подмене индекса (refresh_index)
+        cached = self.answer_cache.lookup(query_embedding)
+        if cached is not None:
+            print("[RAGCore] Answer cache hit.")
+        return cached
+
+    def _remember_answer(self, index: VectorIndex, query_embedding: list, response: dict) -> None:
+        # Ответ по уже замененной версии индекса в кэш новой версии не попадает
+        if index is self.index:
+            self.answer_cache.put(query_embedding, response)
+
+    def get_recommendations(
+        self,
+        user_background: str,
+        program_title: Optional[str] = None,
+        semester: Optional[str] = None,
+    ) -> dict:
+        """
+        Генерирует персонализированные рекомендации по курсам.
+        program_title и semester позволяют ограничить выбор дисциплин.
+        """
         print(
             f"[RAGCore] Generating recommendations for background: {user_background[:50]}..."
         )
-        elective_retriever = self.vectordb.as_retriever(
-            search_kwargs={"k": 30}
+        with self._use_index() as index:
+            with observe_stage("recommendation", "embedding"):
+                query_embedding = self.embedding_service.embed_query(
+                    self._electives_query(user_background)
+                )
+            with observe_stage("recommendation", "retrieval"):
+                docs = self._retrieve_electives(index, query_embedding, program_title, semester)
+            if not docs:
+                return self._no_electives_response(index)
+
+            with observe_stage("recommendation", "context"):
+                docs = self._select_electives(user_background, docs)
+            with observe_stage("recommendation", "prompt"):
+                prompt = self._recommendation_prompt(user_background, docs)
+            try:
+                with observe_stage("recommendation", "llm"):
+                    answer = self.llm_client.invoke(prompt)
+            except LLMUnavailable as e:
+                return self._degraded_recommendation_response("recommendation", index, docs, e)
+            return self._build_response(answer, docs, index)
+
+    async def aget_recommendations(
+        self,
+        user_background: str,
+        program_title: Optional[str] = None,
+        semester: Optional[str] = None,
+    ) -> dict:
+        """Асинхронная версия get_recommendations."""
+        print(
+            f"[RAGCore] Generating recommendations (async) for background: {user_background[:50]}..."
+        )
+        with self._use_index() as index:
+            with observe_stage("recommendation", "embedding"):
+                query_embedding = await self.embedding_service.aembed_query(
+                    self._electives_query(user_background)
+                )
+            with observe_stage("recommendation", "retrieval"):
+                docs = await self._run_in_executor(
+                    self._retrieve_electives, index, query_embedding, program_title, semester
+                )
+            if not docs:
+                return self._no_electives_response(index)
+
+            with observe_stage("recommendation", "context"):
+                docs = await self._run_in_executor(self._select_electives, user_background, docs)
+            with observe_stage("recommendation", "prompt"):
+                prompt = self._recommendation_prompt(user_background, docs)
+            try:
+                with observe_stage("recommendation", "llm"):
+                    answer = await self.llm_client.ainvoke(prompt)
+            except LLMUnavailable as e:
+                return self._degraded_recommendation_response("recommendation", index, docs, e)
+            return self._build_response(answer, docs, index)
+
+    async def astream_recommendations(
+        self,
+        user_background: str,
+        program_title: Optional[str] = None,
+        semester: Optional[str] = None,
+    ) -> AsyncIterator[dict]:
+        """Потоковая версия get_recommendations (формат событий как у astream_answer_query)."""
+        print(
+            f"[RAGCore] Streaming recommendations for background: {user_background[:50]}..."
         )
-        docs = elective_retriever.invoke(f"Дисцпилины для человека с опытом: {user_background}")
+        with self._use_index() as index:
+            with observe_stage("recommendation_stream", "embedding"):
+                query_embedding = await self.embedding_service.aembed_query(
+                    self._electives_query(user_background)
+                )
+            with observe_stage("recommendation_stream", "retrieval"):
+                docs = await self._run_in_executor(
+                    self._retrieve_electives, index, query_embedding, program_title, semester
+                )
+            if not docs:
+                response = self._no_electives_response(index)
+                yield {"type": "token", "content": response["answer"]}
+                yield {"type": "final", **response}
+                return
+
+            with observe_stage("recommendation_stream", "context"):
+                docs = await self._run_in_executor(self._select_electives, user_background, docs)
+            with observe_stage("recommendation_stream", "prompt"):
+                prompt = self._recommendation_prompt(user_background, docs)
+
+            chunks = []
+            try:
+                async for chunk in self._astream_llm("recommendation_stream", prompt):
+                    chunks.append(chunk)
+                    yield {"type": "token", "content": chunk}
+            except LLMUnavailable as e:
+                if chunks:
+                    raise
+                response = self._degraded_recommendation_response(
+                    "recommendation_stream", index, docs, e
+                )
+                yield {"type": "token", "content": response["answer"]}
+                yield {"type": "final", **response}
+                return
+
+            yield {"type": "final", **self._build_response("".join(chunks), docs, index)}
+
+    async def _astream_llm(self, operation: str, prompt) -> AsyncIterator[str]:
+        """Стримит ответ LLM, замеряя время до первого токена и всей генерации."""
+        started = time.perf_counter()
+        first_token = True
+        async for chunk in self.llm_client.astream(prompt):
+            if first_token:
+                record_stage(operation, "llm_first_token", time.perf_counter() - started)
+                first_token = False
+            yield chunk
+        record_stage(operation, "llm", time.perf_counter() - started)
+
+    @staticmethod
+    def _qa_prompt(query: str, docs: list):
+        context = "\n\n".join(doc.page_content for doc in docs)
+        return QA_PROMPT.invoke({"input": query, "context": context})
 
-        if not docs:
-            return {
-                "answer": "К сожалению, я не смог найти информацию о курсах по выбору.",
-                "source_documents": [],
+    def _recommendation_prompt(self, user_background: str, docs: list):
+        return RECOMMENDATION_PROMPT.invoke(
+            {
+                "user_background": user_background,
+                "courses_list": self._format_courses_list(docs),
             }
+        )
+
+    async def _run_in_executor(self, func, *args):
+        """Выполняет блокирующую функцию в пуле потоков RAGCore."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def _electives_query(user_background: str) -> str:
+        return f"Дисцпилины для человека с опытом: {user_background}"
 
-        courses_list = "\n".join(
-            f"- {doc.metadata['course_name']} (Программа: {doc.metadata['program_title']}, Семестр: {doc.metadata['semester']})"
-            for doc in docs
+    @staticmethod
+    def _retrieve_electives(
+        index: VectorIndex,
+        query_embedding: list,
+        program_title: Optional[str] = None,
+        semester: Optional[str] = None,
+    ) -> list:
+        """
+        Ищет только среди документов-дисциплин (type == "course_info")
+        и убирает повторы одной дисциплины в разных программах и семестрах.
+        """
+        conditions = [{"type": "course_info"}]
+        if program_title:
+            conditions.append({"program_title": program_title})
+        if semester:
+            conditions.append({"semester": str(semester)})
+        metadata_filter = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+        docs = index.retriever.similarity_search_by_vector(
+            query_embedding, k=ELECTIVES_CANDIDATES_K, filter=metadata_filter
         )
 
-        recommendation_chain = RECOMMENDATION_PROMPT | self.llm
-        result = recommendation_chain.invoke(
-            {"user_background": user_background, "courses_list": courses_list}
+        unique_docs = []
+        seen_courses = set()
+        for doc in docs:
+            course_key = doc.metadata["course_name"].casefold()
+            if course_key in seen_courses:
+                continue
+            seen_courses.add(course_key)
+            unique_docs.append(doc)
+        return unique_docs
+
+    def _select_qa_context(self, query: str, candidates: list) -> list:
+        """Лучшие фрагменты для QA-промпта в пределах бюджета токенов."""
+        return self.context_builder.build(
+            query, candidates, QA_CONTEXT_TOKEN_BUDGET, QA_TOP_K
+        )
+
+    def _select_electives(self, user_background: str, docs: list) -> list:
+        """Дисциплины, наиболее подходящие бэкграунду, в пределах бюджета токенов."""
+        return self.context_builder.build(
+            user_background,
+            docs,
+            RECOMMENDATION_CONTEXT_TOKEN_BUDGET,
+            ELECTIVES_TOP_K,
+            render=self._format_course_line,
+        )
+
+    @staticmethod
+    def _format_course_line(doc: Document) -> str:
+        return f"- {doc.metadata['course_name']} (Программа: {doc.metadata['program_title']}, Семестр: {doc.metadata['semester']})"
+
+    def _format_courses_list(self, docs: list) -> str:
+        return "\n".join(self._format_course_line(doc) for doc in docs)
+
+    def _degraded_qa_response(
+        self, operation: str, index: VectorIndex, docs: list, error: Exception
+    ) -> dict:
+        """Ответ из найденных фрагментов, когда LLM недоступна."""
+        print(f"[RAGCore] LLM unavailable ({error}), answering with retrieved snippets")
+        DEGRADED_ANSWERS.labels(operation).inc()
+        snippets = "\n\n".join(
+            f"- {doc.page_content[:DEGRADED_SNIPPET_CHARS]}" for doc in docs[:DEGRADED_SNIPPETS]
         )
+        response = self._build_response(f"{DEGRADED_QA_ANSWER}\n\n{snippets}", docs, index)
+        return {**response, "degraded": True}
 
+    def _degraded_recommendation_response(
+        self, operation: str, index: VectorIndex, docs: list, error: Exception
+    ) -> dict:
+        """Список подходящих дисциплин без обоснований, когда LLM недоступна."""
+        print(f"[RAGCore] LLM unavailable ({error}), answering with the electives list")
+        DEGRADED_ANSWERS.labels(operation).inc()
+        courses = self._format_courses_list(docs[:DEGRADED_COURSES])
+        answer = f"{DEGRADED_RECOMMENDATION_ANSWER}\n{courses}"
+        return {**self._build_response(answer, docs, index), "degraded": True}
+
+    @staticmethod
+    def _no_electives_response(index: VectorIndex) -> dict:
         return {
-            "answer": result.content,
+            "answer": "К сожалению, я не смог найти информацию о курсах по выбору.",
+            "source_documents": [],
+            "index_version": index.version,
+        }
+
+    @staticmethod
+    def _build_response(answer: str, docs: list, index: VectorIndex) -> dict:
+        return {
+            "answer": answer,
+            "index_version": index.version,
             "source_documents": [
-                {"page_content": doc.page_content, "metadata": doc.metadata}
+                {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata}
                 for doc in docs
             ],
         }
 
 
-rag_core_instance = RAGCore()
+# Экземпляр создается в lifespan приложения (см. main.py), а не при импорте
+rag_core_instance: Optional[RAGCore] = None
+_preloaded_embedding_model: Optional[HuggingFaceEmbeddings] = None
+
+
+def preload_embedding_model() -> None:
+    """
+    Загружает веса модели эмбеддингов заранее, в мастер-процессе до fork
+    (например, gunicorn --preload), чтобы воркеры разделяли их copy-on-write.
+    Chroma здесь не открывается: SQLite-соединения нельзя переносить через fork.
+    """
+    global _preloaded_embedding_model
+    print("[RAGCore] Preloading embedding model before fork...")
+    _preloaded_embedding_model = create_embedding_model()
+    # Объекты, созданные до fork, не должны трогаться сборщиком мусора в воркерах
+    gc.freeze()
+
+
+def init_rag_core() -> RAGCore:
+    """Создает и прогревает RAGCore. После этого сервис готов принимать запросы."""
+    global rag_core_instance
+    core = RAGCore(embedding_model=_preloaded_embedding_model)
+    core.warmup()
+    core.start_index_watcher()
+    rag_core_instance = core
+    return core
+
+
+def get_rag_core() -> RAGCore:
+    if rag_core_instance is None:
+        raise RAGCoreNotReady()
+    return rag_core_instance
@@ -1,5 +1,12 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, List
+
+# Как возвращать источники ответа:
+# "full"     — полный текст и метаданные документов;
+# "snippets" — текст, обрезанный до SOURCE_SNIPPET_CHARS символов, и метаданные;
+# "metadata" — только id и метаданные;
+# "none"     — без источников (боту нужен только answer).
+SourcesMode = Literal["full", "snippets", "metadata", "none"]
 
 
 class QueryRequest(BaseModel):
@@ -9,12 +16,17 @@ class QueryRequest(BaseModel):
         str  # Используем str для универсальности (TG ID - int, но может быть и UUID)
     )
     query_text: str
+    # Необязательные фильтры для рекомендаций по курсам
+    program_title: Optional[str] = None
+    semester: Optional[str] = None
+    sources: SourcesMode = "full"
 
 
 class SourceDocument(BaseModel):
     """Модель для исходного документа, на основе которого дан ответ."""
 
-    page_content: str
+    id: Optional[str] = None
+    page_content: Optional[str] = None
     metadata: dict
 
 
@@ -23,3 +35,30 @@ class QueryResponse(BaseModel):
 
     answer: str
     source_documents: Optional[List[SourceDocument]] = None
+    # True, если LLM была недоступна и ответ собран из найденных фрагментов
+    degraded: bool = False
+    # Версия векторного индекса, по которой найдены источники
+    index_version: Optional[str] = None
+
+
+class BatchQueryRequest(BaseModel):
+    """Пакет общих вопросов (без состояния диалога) для регрессии и FAQ."""
+
+    queries: List[str] = Field(min_length=1, max_length=256)
+    sources: SourcesMode = "full"
+
+
+class BatchQueryResult(BaseModel):
+    """Ответ на один вопрос пакета: либо answer, либо error."""
+
+    answer: Optional[str] = None
+    source_documents: Optional[List[SourceDocument]] = None
+    degraded: bool = False
+    index_version: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """Ответы в порядке вопросов запроса."""
+
+    results: List[BatchQueryResult]
@@ -0,0 +1,120 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Optional, Tuple
+
+from .metrics import COALESCED_REQUESTS
+
+
+class SharedStream:
+    """
+    Поток событий одного вычисления, который могут читать несколько подписчиков.
+    Каждый подписчик получает все события с начала потока, в том числе
+    пришедшие до его подключения.
+    """
+
+    def __init__(self, source: AsyncIterator[dict]):
+        self.events: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+    async def _pump(self, source: AsyncIterator[dict]) -> None:
+        # Поток читается отдельной задачей: отключение первого клиента
+        # не прерывает ответ для остальных
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы: пока вычисление с ключом key
+    выполняется, новые запросы с тем же ключом не запускают свое,
+    а дожидаются результата уже идущего.
+    """
+
+    def __init__(self):
+        self._calls: "dict[Hashable, asyncio.Future]" = {}
+        self._streams: "dict[Hashable, SharedStream]" = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, operation: str, compute: Callable[[], Awaitable]):
+        """Возвращает результат compute(), общий для всех одновременных вызовов с key."""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(compute())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        else:
+            self._count_coalesced(operation)
+        # shield: отмена одного ожидающего (разрыв соединения) не отменяет общее вычисление
+        return await asyncio.shield(task)
+
+    def join_stream(self, key: Hashable, operation: str) -> Optional[AsyncIterator[dict]]:
+        """Подписка на уже идущий поток с ключом key или None."""
+        shared = self._streams.get(key)
+        if shared is None:
+            return None
+        self._count_coalesced(operation)
+        return shared.subscribe()
+
+    def start_stream(
+        self, key: Hashable, operation: str, source: Callable[[], AsyncIterator[dict]]
+    ) -> Tuple[AsyncIterator[dict], bool]:
+        """
+        Запускает поток source() под ключом key и подписывается на него.
+        Если поток с таким ключом успел появиться, подписывается на него,
+        а source не вызывается; второй элемент результата — запущен ли новый поток.
+        """
+        existing = self.join_stream(key, operation)
+        if existing is not None:
+            return existing, False
+        self.leaders += 1
+        shared = SharedStream(source())
+        self._streams[key] = shared
+        shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        return shared.subscribe(), True
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+    def _count_coalesced(self, operation: str) -> None:
+        self.coalesced += 1
+        COALESCED_REQUESTS.labels(operation).inc()
+
+    @staticmethod
+    def _forget(registry: dict, key: Hashable, value) -> None:
+        if registry.get(key) is value:
+            del registry[key]
+        # Забираем исключение, если результат никто не дождался
+        if isinstance(value, asyncio.Future) and not value.cancelled():
+            value.exception()
@@ -0,0 +1,105 @@
+import os
+import threading
+from typing import Tuple
+
+from langchain_chroma import Chroma
+
+from .answer_cache import read_index_version
+from .flat_index import load_or_export_flat_index
+
+# Бэкенд поиска: "chroma" — запросы к Chroma; "flat" — точный поиск по выгрузке
+# коллекции в memory-mapped матрицу (FLAT_INDEX_PATH, по умолчанию <папка индекса>/flat_index)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")
+FLAT_INDEX_PATH = os.getenv("FLAT_INDEX_PATH", "")
+
+# Индексер публикует версии в VECTOR_DB_PATH/versions/<версия>,
+# а VECTOR_DB_PATH/current — симлинк на опубликованную версию
+CURRENT_LINK = "current"
+VERSIONS_DIR = "versions"
+
+
+def resolve_current_index(root: str) -> Tuple[str, str]:
+    """
+    Папка и версия опубликованного индекса. Если симлинка current нет
+    (индекс собран до появления версий), индексом считается сама папка root.
+    """
+    link = os.path.join(root, CURRENT_LINK)
+    if os.path.lexists(link):
+        path = os.path.realpath(link)
+        return path, read_index_version(path) or os.path.basename(path)
+    return root, read_index_version(root)
+
+
+class VectorIndex:
+    """
+    Открытая версия индекса: Chroma и, при VECTOR_INDEX_BACKEND=flat, плоский индекс.
+    Запрос берет ссылку на VectorIndex один раз (acquire) и работает с ней до конца,
+    поэтому подмена индекса в RAGCore не затрагивает уже идущие запросы.
+    Замененная версия (retire) закрывается, когда ее отпустит последний запрос.
+    """
+
+    def __init__(self, path: str, version: str, vectordb: Chroma, flat_index=None):
+        self.path = path
+        self.version = version
+        self.vectordb = vectordb
+        self.flat_index = flat_index
+        # Поиск по вектору: Chroma или плоский индекс с тем же интерфейсом
+        self.retriever = vectordb if flat_index is None else flat_index
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._users += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            close_now = self._retired and self._users == 0
+        if close_now:
+            self.close()
+
+    def retire(self) -> None:
+        """Помечает версию замененной: закрыть сразу или после последнего запроса."""
+        with self._lock:
+            self._retired = True
+            close_now = self._users == 0
+        if close_now:
+            self.close()
+
+    def close(self) -> None:
+        """Останавливает систему Chroma этой версии и убирает ее из общего кэша клиентов."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        _close_chroma_client(self.vectordb._client)
+        print(f"[RAGCore] Closed index version {self.version!r}")
+
+
+def open_vector_index(path: str, version: str, embedding_model) -> VectorIndex:
+    vectordb = Chroma(persist_directory=path, embedding_function=embedding_model)
+    flat_index = None
+    if VECTOR_INDEX_BACKEND == "flat":
+        flat_index = load_or_export_flat_index(
+            vectordb, FLAT_INDEX_PATH or os.path.join(path, "flat_index"), version
+        )
+        print(f"[RAGCore] Using flat vector index ({len(flat_index)} documents)")
+    elif VECTOR_INDEX_BACKEND != "chroma":
+        raise ValueError(f"Unknown VECTOR_INDEX_BACKEND {VECTOR_INDEX_BACKEND!r}")
+    return VectorIndex(path, version, vectordb, flat_index)
+
+
+def _close_chroma_client(client) -> None:
+    # Chroma кэширует System (SQLite, сегменты) по папке в SharedSystemClient
+    # и сама его не освобождает; в новых версиях для этого есть Client.close()
+    if hasattr(client, "close"):
+        client.close()
+        return
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    system = SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+    if system is not None:
+        system.stop()
@@ -0,0 +1,139 @@
+"""
+Бенчмарк парсера учебных планов на наборе PDF из benchmarks/fixtures/curricula.
+
+Для каждого PDF рядом хранится эталонный результат <name>.golden.json.
+Скрипт проверяет, что при любом числе воркеров парсер выдает ровно
+эталонный список дисциплин, и печатает pages/sec и пиковую память в JSON.
+
+    python benchmarks/bench_curriculum_parser.py --workers 1 4
+    python benchmarks/bench_curriculum_parser.py --workers 1 4 --min-parallel-pages 0   # замерить пул процессов
+    python benchmarks/bench_curriculum_parser.py --collect-from-cache   # пополнить набор из data/http_cache
+    python benchmarks/bench_curriculum_parser.py --update-golden        # перезаписать эталоны
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data_collector"))
+
+import curriculum  # noqa: E402
+from curriculum import iter_curriculum_disciplines, shutdown_pool  # noqa: E402
+from pypdf import PdfReader  # noqa: E402
+
+FIXTURES_DIR = ROOT / "benchmarks" / "fixtures" / "curricula"
+HTTP_CACHE_DIR = ROOT / "data" / "http_cache"
+
+
+def collect_from_cache() -> None:
+    """Копирует PDF учебных планов из HTTP-кэша парсера в набор фикстур."""
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    for meta_path in sorted(HTTP_CACHE_DIR.glob("*.json")):
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if not meta.get("url", "").endswith("/pdf"):
+            continue
+        body_path = meta_path.with_suffix(".body")
+        program_id = meta["url"].rstrip("/").split("/")[-4]
+        target = FIXTURES_DIR / f"program_{program_id}.pdf"
+        shutil.copyfile(body_path, target)
+        print(f"[bench] collected {target.name}", file=sys.stderr)
+
+
+def run_once(pdf_path: Path, workers: int) -> dict:
+    page_count = len(PdfReader(str(pdf_path)).pages)
+
+    started = time.perf_counter()
+    disciplines = list(iter_curriculum_disciplines(str(pdf_path), workers=workers))
+    elapsed = time.perf_counter() - started
+
+    # Память меряем отдельным прогоном: tracemalloc сильно замедляет парсинг
+    tracemalloc.start()
+    for _ in iter_curriculum_disciplines(str(pdf_path), workers=workers):
+        pass
+    _, peak_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "fixture": pdf_path.name,
+        "workers": workers,
+        "pages": page_count,
+        "disciplines": len(disciplines),
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(page_count / elapsed, 2) if elapsed else None,
+        "peak_python_mb": round(peak_python / 2**20, 2),
+        "_result": disciplines,
+    }
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--update-golden", action="store_true")
+    arg_parser.add_argument(
+        "--min-parallel-pages",
+        type=int,
+        default=curriculum.PARALLEL_MIN_PAGES,
+        help="С какого числа страниц включать пул процессов (0 — всегда, чтобы замерить его)",
+    )
+    arg_parser.add_argument("--collect-from-cache", action="store_true")
+    args = arg_parser.parse_args()
+    curriculum.PARALLEL_MIN_PAGES = args.min_parallel_pages
+
+    if args.collect_from_cache:
+        collect_from_cache()
+
+    fixtures = sorted(FIXTURES_DIR.glob("*.pdf"))
+    if not fixtures:
+        print(f"[bench] no PDFs in {FIXTURES_DIR}", file=sys.stderr)
+        return 1
+
+    results = []
+    mismatches = []
+    for pdf_path in fixtures:
+        golden_path = pdf_path.with_suffix(".golden.json")
+        for workers in args.workers:
+            runs = [run_once(pdf_path, workers) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            disciplines = best.pop("_result")
+
+            if args.update_golden:
+                golden_path.write_text(
+                    json.dumps(disciplines, ensure_ascii=False, indent=2),
+                    encoding="utf-8",
+                )
+            elif golden_path.exists():
+                golden = json.loads(golden_path.read_text(encoding="utf-8"))
+                best["golden_match"] = golden == disciplines
+                if not best["golden_match"]:
+                    mismatches.append(f"{pdf_path.name} (workers={workers})")
+            results.append(best)
+    # Дочерние процессы попадают в RUSAGE_CHILDREN только после завершения
+    shutdown_pool()
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "results": results,
+                # ru_maxrss в Linux — в килобайтах
+                "peak_rss_mb": round(usage_self / 1024, 2),
+                "peak_child_rss_mb": round(usage_children / 1024, 2),
+                "golden_mismatches": mismatches,
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Проверка маршрутизации вопросов в CourseCatalog на наборе из
+benchmarks/fixtures/catalog_intents.json: каталог собирается из
+benchmarks/fixtures/structured_programs.json во временный файл, и для каждого
+вопроса сравнивается ожидаемое намерение (list, hours, semester или rag —
+вопрос должен уйти в RAG) с тем, что выбрал каталог.
+
+    python benchmarks/catalog_intents.py
+"""
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "data_collector"))
+
+from backend.app.catalog import CourseCatalog, normalize_name  # noqa: E402
+from catalog import build_catalog  # noqa: E402
+
+FIXTURES_DIR = ROOT / "benchmarks" / "fixtures"
+
+
+def main() -> int:
+    cases = json.loads((FIXTURES_DIR / "catalog_intents.json").read_text(encoding="utf-8"))
+    programs = json.loads(
+        (FIXTURES_DIR / "structured_programs.json").read_text(encoding="utf-8")
+    )
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "catalog.sqlite3")
+        build_catalog(programs, db_path)
+        catalog = CourseCatalog(db_path)
+        catalog._refresh()
+        for expected, questions in cases.items():
+            for question in questions:
+                intent, _ = catalog._answer(normalize_name(question))
+                if (intent or "rag") != expected:
+                    mismatches.append(
+                        {"question": question, "expected": expected, "got": intent or "rag"}
+                    )
+
+    total = sum(len(questions) for questions in cases.values())
+    print(json.dumps({"cases": total, "mismatches": mismatches}, ensure_ascii=False, indent=2))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Сравнивает бэкенд эмбеддингов (например, ONNX int8) с эталонной FP32-моделью:
+задержку эмбеддинга запроса, прирост памяти и recall@k относительно
+текущих результатов Chroma в VECTOR_DB_PATH.
+
+    python benchmarks/embedding_drift.py --candidate onnx-int8 --k 8
+    python benchmarks/embedding_drift.py --candidate onnx-int8 --full   # пересчитать и документы
+
+recall@k (query) — индекс остается FP32, кандидат эмбеддит только запросы.
+recall@k (full)  — кандидат эмбеддит и запросы, и все документы коллекции,
+                   как если бы индекс был пересобран на этом бэкенде.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.app.embeddings import EMBEDDING_BACKENDS, create_embedding_model  # noqa: E402
+from backend.app.vector_index import resolve_current_index  # noqa: E402
+from langchain_chroma import Chroma  # noqa: E402
+
+QUERIES_PATH = ROOT / "benchmarks" / "fixtures" / "queries.json"
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса в МБ (Linux)."""
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def load_queries() -> list:
+    data = json.loads(QUERIES_PATH.read_text(encoding="utf-8"))
+    return data["general"] + [
+        f"Дисцпилины для человека с опытом: {background}"
+        for background in data["backgrounds"]
+    ]
+
+
+def profile_backend(backend: str, queries: list) -> tuple:
+    """Загружает модель, возвращает (модель, эмбеддинги запросов, метрики)."""
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    model = create_embedding_model(backend)
+    load_seconds = time.perf_counter() - started
+    model.embed_query(queries[0])  # прогрев
+
+    latencies = []
+    embeddings = []
+    for query in queries:
+        started = time.perf_counter()
+        embeddings.append(model.embed_query(query))
+        latencies.append(1000 * (time.perf_counter() - started))
+
+    latencies.sort()
+    metrics = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "rss_delta_mb": round(rss_mb() - rss_before, 1),
+        "query_latency_ms_p50": round(statistics.median(latencies), 2),
+        "query_latency_ms_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+    return model, embeddings, metrics
+
+
+def top_k_ids(vectordb: Chroma, embedding: list, k: int) -> list:
+    return [doc.id for doc in vectordb.similarity_search_by_vector(embedding, k=k)]
+
+
+def recall(reference: list, candidate: list) -> float:
+    return len(set(reference) & set(candidate)) / len(reference) if reference else 1.0
+
+
+def main() -> None:
+    load_dotenv()
+
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--reference", default="torch", choices=EMBEDDING_BACKENDS)
+    arg_parser.add_argument("--candidate", default="onnx-int8", choices=EMBEDDING_BACKENDS)
+    arg_parser.add_argument("--k", type=int, default=8)
+    arg_parser.add_argument("--full", action="store_true")
+    args = arg_parser.parse_args()
+
+    queries = load_queries()
+    index_path, _ = resolve_current_index(os.environ["VECTOR_DB_PATH"])
+    vectordb = Chroma(persist_directory=index_path)
+
+    _, reference_embeddings, reference_metrics = profile_backend(args.reference, queries)
+    candidate_model, candidate_embeddings, candidate_metrics = profile_backend(
+        args.candidate, queries
+    )
+
+    reference_ids = [top_k_ids(vectordb, e, args.k) for e in reference_embeddings]
+    candidate_ids = [top_k_ids(vectordb, e, args.k) for e in candidate_embeddings]
+    query_recalls = [recall(r, c) for r, c in zip(reference_ids, candidate_ids)]
+
+    report = {
+        "k": args.k,
+        "queries": len(queries),
+        "reference": reference_metrics,
+        "candidate": candidate_metrics,
+        "recall_at_k_query": round(float(np.mean(query_recalls)), 4),
+        "recall_at_k_query_min": round(min(query_recalls), 4),
+    }
+
+    if args.full:
+        collection = vectordb.get(include=["documents"])
+        doc_matrix = np.asarray(
+            candidate_model.embed_documents(collection["documents"]), dtype=np.float32
+        )
+        doc_matrix /= np.linalg.norm(doc_matrix, axis=1, keepdims=True)
+        full_recalls = []
+        for embedding, expected in zip(candidate_embeddings, reference_ids):
+            query = np.asarray(embedding, dtype=np.float32)
+            scores = doc_matrix @ (query / np.linalg.norm(query))
+            best = np.argsort(-scores)[: args.k]
+            full_recalls.append(recall(expected, [collection["ids"][i] for i in best]))
+        report["recall_at_k_full"] = round(float(np.mean(full_recalls)), 4)
+        report["recall_at_k_full_min"] = round(min(full_recalls), 4)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Генерирует синтетические PDF учебных планов в формате abit.itmo.ru
+для бенчмарка парсера. Требует reportlab и шрифт DejaVuSans
+(в requirements.txt не входит — нужен только для пересборки фикстур).
+
+    python benchmarks/fixtures/make_curricula.py
+    python benchmarks/bench_curriculum_parser.py --update-golden
+"""
+
+import random
+from pathlib import Path
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+OUTPUT_DIR = Path(__file__).resolve().parent / "curricula"
+LINES_PER_PAGE = 45
+
+TOPICS = [
+    "Машинное обучение",
+    "Глубокое обучение",
+    "Обработка естественного языка",
+    "Компьютерное зрение",
+    "Управление продуктом",
+    "Аналитика данных",
+    "Рекомендательные системы",
+    "Инженерия данных",
+    "Математическая статистика",
+    "Проектирование ML-систем",
+    "Генеративные модели",
+    "Продуктовые метрики",
+]
+SUFFIXES = ["", " / Advanced", " в индустрии", ": практикум", " и приложения"]
+
+
+def curriculum_lines(seed: int, semesters: int, courses_per_pool: int) -> list:
+    rng = random.Random(seed)
+    lines = [
+        "Семестры Наименование модулей и дисциплин Трудоемкость (з.е.) Трудоемкость (час.)"
+    ]
+    for block in (1, 2, 3):
+        lines.append(f"Блок {block}. Модули (дисциплины) {30 * block} {1080 * block}")
+        for semester in range(1, semesters + 1):
+            lines.append(f"Обязательные дисциплины. {semester} семестр 12 432")
+            for _ in range(courses_per_pool // 2):
+                ze = rng.choice([2, 3, 4, 5, 6])
+                name = rng.choice(TOPICS) + rng.choice(SUFFIXES)
+                lines.append(f"{semester} {name} {ze} {ze * 36}")
+            lines.append(f"Пул выборных дисциплин. {semester} семестр 18 648")
+            for _ in range(courses_per_pool):
+                ze = rng.choice([3, 4, 5])
+                name = rng.choice(TOPICS) + rng.choice(SUFFIXES)
+                lines.append(f"{semester} {name} {ze} {ze * 36}")
+    return lines
+
+
+def write_pdf(path: Path, lines: list) -> None:
+    pdf = canvas.Canvas(str(path), pagesize=A4)
+    pdf.setFont("DejaVuSans", 9)
+    for start in range(0, len(lines), LINES_PER_PAGE):
+        y = A4[1] - 40
+        for line in lines[start : start + LINES_PER_PAGE]:
+            pdf.drawString(30, y, line)
+            y -= 17
+        pdf.showPage()
+        pdf.setFont("DejaVuSans", 9)
+    pdf.save()
+
+
+def main():
+    pdfmetrics.registerFont(TTFont("DejaVuSans", FONT_PATH))
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    fixtures = {
+        "small_2_semesters.pdf": curriculum_lines(seed=1, semesters=2, courses_per_pool=8),
+        "large_4_semesters.pdf": curriculum_lines(seed=2, semesters=4, courses_per_pool=60),
+    }
+    for name, lines in fixtures.items():
+        write_pdf(OUTPUT_DIR / name, lines)
+        print(f"[fixtures] {name}: {len(lines)} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Офлайн нагрузочный тест backend без обращения к ChatLLM7.
+
+Поднимает FastAPI-приложение в процессе (httpx.ASGITransport) с детерминированной
+FakeChatLLM и небольшим индексом Chroma, собранным из
+benchmarks/fixtures/structured_programs.json, и гоняет /v1/chat
+с заданной конкурентностью и долей запросов на рекомендации.
+Печатает JSON с пропускной способностью и p50/p95/p99 по типам запросов
+и по стадиям (embedding, retrieval, llm), который удобно сравнивать между коммитами.
+
+    python benchmarks/load_test.py --requests 200 --concurrency 16 --recommendation-ratio 0.2
+    python benchmarks/load_test.py --embeddings fake --llm-latency-ms 800 --output bench.json
+    python benchmarks/load_test.py --llm-slow-rate 0.1 --llm-slow-latency-ms 5000 --llm-hedge
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = ROOT / "benchmarks" / "fixtures"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "data_collector"))
+
+
+class StageRecorder:
+    """Собирает длительности стадий обработки запроса."""
+
+    def __init__(self):
+        self.durations: dict[str, list] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.durations.setdefault(stage, []).append(seconds)
+
+
+class TimedProxy:
+    """Прокси, который замеряет время вызова выбранных методов объекта."""
+
+    SYNC_METHODS = {
+        "invoke",
+        "embed_query",
+        "embed_documents",
+        "similarity_search_by_vector",
+        "search_batch",
+    }
+    ASYNC_METHODS = {"ainvoke"}
+
+    def __init__(self, target, stage: str, recorder: StageRecorder):
+        self._target = target
+        self._stage = stage
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self.SYNC_METHODS:
+
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    self._recorder.record(self._stage, time.perf_counter() - started)
+
+            return timed
+        if name in self.ASYNC_METHODS:
+
+            async def atimed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await attr(*args, **kwargs)
+                finally:
+                    self._recorder.record(self._stage, time.perf_counter() - started)
+
+            return atimed
+        return attr
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(1000 * ordered[-1], 2),
+    }
+
+
+def configure_environment(args, vector_db_path: str) -> None:
+    # Конфигурация backend читается при импорте, поэтому задаем ее заранее
+    os.environ["VECTOR_DB_PATH"] = vector_db_path
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(args.llm_tokens_per_sec)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.llm_failure_rate)
+    os.environ["FAKE_LLM_SLOW_RATE"] = str(args.llm_slow_rate)
+    os.environ["FAKE_LLM_SLOW_LATENCY_MS"] = str(args.llm_slow_latency_ms)
+    # По умолчанию модель только синхронная, как ChatLLM7: вызовы идут через пул потоков
+    os.environ["FAKE_LLM_NATIVE_ASYNC"] = "1" if args.llm_native_async else "0"
+    os.environ["LLM_TIMEOUT_SECONDS"] = str(args.llm_timeout)
+    os.environ["LLM_HEDGE"] = "1" if args.llm_hedge else "0"
+    os.environ["ANSWER_CACHE_SIZE"] = str(args.answer_cache_size)
+    os.environ["ANSWER_CACHE_PATH"] = ""
+    os.environ["CONVERSATION_STORE"] = "memory"
+    os.environ["MAX_CONCURRENT_CHATS"] = str(args.max_concurrent_chats)
+    os.environ["MAX_QUEUED_CHATS"] = str(args.requests)
+    os.environ["RERANKER_MODEL"] = args.reranker
+    os.environ["VECTOR_INDEX_BACKEND"] = args.vector_index
+    os.environ.setdefault("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    os.environ.setdefault("LLM_MODEL_NAME", "fake")
+
+
+def create_embeddings(kind: str):
+    if kind == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        return DeterministicFakeEmbedding(size=384)
+    from backend.app.embeddings import create_embedding_model
+
+    return create_embedding_model()
+
+
+def build_fixture_index(embeddings, vector_db_path: str) -> int:
+    from indexer import create_documents_from_data, load_structured_data, sync_vector_store
+    from langchain_chroma import Chroma
+
+    documents = create_documents_from_data(
+        load_structured_data(str(FIXTURES_DIR / "structured_programs.json"))
+    )
+    vectordb = Chroma(persist_directory=vector_db_path, embedding_function=embeddings)
+    sync_vector_store(vectordb, documents)
+    return len(documents)
+
+
+async def run_load(args, recorder: StageRecorder) -> dict:
+    import httpx
+    from backend.app import main as backend_main
+    from backend.app.conversation_state import ConversationRecord
+
+    queries = json.loads((FIXTURES_DIR / "queries.json").read_text(encoding="utf-8"))
+    rng = random.Random(args.seed)
+
+    workload = []
+    for i in range(args.requests):
+        if rng.random() < args.recommendation_ratio:
+            chat_id = f"bench-rec-{i}"
+            backend_main.conversation_store.set(
+                chat_id, ConversationRecord(background=rng.choice(queries["backgrounds"]))
+            )
+            workload.append(("recommendation", chat_id, "Посоветуй курсы"))
+        else:
+            workload.append(("general", f"bench-{i}", rng.choice(queries["general"])))
+
+    latencies: dict[str, list] = {"general": [], "recommendation": []}
+    errors: dict[str, int] = {}
+    degraded = 0
+    queue = asyncio.Queue()
+    for item in workload:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=backend_main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=300
+    ) as client:
+
+        async def worker():
+            nonlocal degraded
+            while not queue.empty():
+                kind, chat_id, text = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(
+                    "/v1/chat", json={"chat_id": chat_id, "query_text": text}
+                )
+                elapsed = time.perf_counter() - started
+                if response.status_code == 200:
+                    latencies[kind].append(elapsed)
+                    degraded += response.json().get("degraded", False)
+                else:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall_time = time.perf_counter() - started
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "wall_time_s": round(wall_time, 3),
+        "completed": completed,
+        "errors": errors,
+        "degraded": degraded,
+        "coalescing": backend_main.single_flight.stats(),
+        "throughput_rps": round(completed / wall_time, 2) if wall_time else None,
+        "latency": {
+            "all": percentiles(latencies["general"] + latencies["recommendation"]),
+            **{kind: percentiles(values) for kind, values in latencies.items()},
+        },
+        "stages": {
+            stage: percentiles(values) for stage, values in sorted(recorder.durations.items())
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    arg_parser.add_argument("--recommendation-ratio", type=float, default=0.2)
+    arg_parser.add_argument("--llm-latency-ms", type=float, default=500)
+    arg_parser.add_argument("--llm-tokens-per-sec", type=float, default=200)
+    arg_parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    arg_parser.add_argument("--llm-slow-rate", type=float, default=0.0)
+    arg_parser.add_argument("--llm-slow-latency-ms", type=float, default=10000)
+    arg_parser.add_argument("--llm-timeout", type=float, default=30)
+    arg_parser.add_argument("--llm-hedge", action="store_true")
+    arg_parser.add_argument(
+        "--llm-native-async",
+        action="store_true",
+        help="FakeChatLLM с async-методами (у ChatLLM7 их нет, поэтому по умолчанию выключено)",
+    )
+    arg_parser.add_argument("--answer-cache-size", type=int, default=0)
+    arg_parser.add_argument("--max-concurrent-chats", type=int, default=64)
+    arg_parser.add_argument("--embeddings", choices=["model", "fake"], default="model")
+    arg_parser.add_argument(
+        "--reranker", default="", help="Модель cross-encoder (по умолчанию без переранжирования)"
+    )
+    arg_parser.add_argument("--vector-index", choices=["chroma", "flat"], default="chroma")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--output", help="Куда дополнительно сохранить JSON-отчет")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-chroma-") as vector_db_path:
+        configure_environment(args, vector_db_path)
+        embeddings = create_embeddings(args.embeddings)
+        documents = build_fixture_index(embeddings, vector_db_path)
+
+        from backend.app import rag_core as rag_core_module
+
+        rag_core_module._preloaded_embedding_model = embeddings
+        core = rag_core_module.init_rag_core()
+
+        recorder = StageRecorder()
+        core.embedding_service.model = TimedProxy(core.embedding_model, "embedding", recorder)
+        core.index.retriever = TimedProxy(core.index.retriever, "retrieval", recorder)
+        core.llm_client = TimedProxy(core.llm_client, "llm", recorder)
+
+        result = asyncio.run(run_load(args, recorder))
+
+    report = {
+        "commit": git_commit(),
+        "config": {**vars(args), "documents": documents},
+        **result,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Сравнивает плоский memory-mapped индекс (VECTOR_INDEX_BACKEND=flat) с Chroma:
+задержку поиска одного запроса (без фильтра и с фильтром по дисциплинам),
+пакетного поиска и recall@k плоского индекса относительно выдачи Chroma.
+
+    python benchmarks/vector_index_bench.py --k 24 --repeat 20
+    python benchmarks/vector_index_bench.py --fixture --embeddings fake   # без модели и VECTOR_DB_PATH
+
+По умолчанию используется коллекция в VECTOR_DB_PATH и модель EMBEDDING_MODEL;
+с --fixture индекс собирается из benchmarks/fixtures/structured_programs.json.
+Для случайных (fake) эмбеддингов порядок по косинусу и по L2 расходится,
+поэтому recall осмыслен только с настоящей моделью.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+sys.path.insert(0, str(ROOT / "data_collector"))
+
+from backend.app.flat_index import FlatVectorIndex, export_flat_index  # noqa: E402
+from backend.app.vector_index import resolve_current_index  # noqa: E402
+from embedding_drift import load_queries, recall  # noqa: E402
+from load_test import build_fixture_index, create_embeddings, percentiles  # noqa: E402
+from langchain_chroma import Chroma  # noqa: E402
+
+# Тот же фильтр, что в RAGCore._retrieve_electives
+ELECTIVES_FILTER = {"type": "course_info"}
+
+
+def time_searches(search, embeddings: list, repeat: int) -> tuple:
+    """Задержки поиска по каждому запросу (repeat проходов) и результаты первого прохода."""
+    latencies = []
+    results = []
+    for attempt in range(repeat):
+        for embedding in embeddings:
+            started = time.perf_counter()
+            docs = search(embedding)
+            latencies.append(time.perf_counter() - started)
+            if attempt == 0:
+                results.append([doc.id for doc in docs])
+    return latencies, results
+
+
+def compare(name: str, chroma_search, flat_search, embeddings: list, repeat: int) -> dict:
+    chroma_search(embeddings[0])  # прогрев
+    flat_search(embeddings[0])
+    chroma_latencies, chroma_ids = time_searches(chroma_search, embeddings, repeat)
+    flat_latencies, flat_ids = time_searches(flat_search, embeddings, repeat)
+    recalls = [recall(reference, candidate) for reference, candidate in zip(chroma_ids, flat_ids)]
+    return {
+        name: {
+            "chroma": percentiles(chroma_latencies),
+            "flat": percentiles(flat_latencies),
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            "recall_at_k_min": round(min(recalls), 4),
+        }
+    }
+
+
+def run(vectordb: Chroma, embeddings_model, args, workdir: str) -> dict:
+    queries = load_queries()
+    embeddings = embeddings_model.embed_documents(queries)
+
+    started = time.perf_counter()
+    flat_path = os.path.join(workdir, "flat_index")
+    export_flat_index(vectordb, flat_path)
+    export_seconds = time.perf_counter() - started
+    flat = FlatVectorIndex(flat_path)
+
+    report = {
+        "documents": len(flat),
+        "queries": len(queries),
+        "k": args.k,
+        "filtered_k": args.filtered_k,
+        "export_seconds": round(export_seconds, 3),
+        "flat_index_mb": round(
+            sum(f.stat().st_size for f in Path(flat_path).iterdir()) / 2**20, 2
+        ),
+    }
+    report.update(
+        compare(
+            "unfiltered",
+            lambda e: vectordb.similarity_search_by_vector(e, k=args.k),
+            lambda e: flat.similarity_search_by_vector(e, k=args.k),
+            embeddings,
+            args.repeat,
+        )
+    )
+    report.update(
+        compare(
+            "filtered",
+            lambda e: vectordb.similarity_search_by_vector(
+                e, k=args.filtered_k, filter=ELECTIVES_FILTER
+            ),
+            lambda e: flat.similarity_search_by_vector(
+                e, k=args.filtered_k, filter=ELECTIVES_FILTER
+            ),
+            embeddings,
+            args.repeat,
+        )
+    )
+
+    batch_latencies = {"chroma": [], "flat": []}
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        vectordb._collection.query(
+            query_embeddings=embeddings, n_results=args.k, include=["documents", "metadatas"]
+        )
+        batch_latencies["chroma"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        flat.search_batch(embeddings, args.k)
+        batch_latencies["flat"].append(time.perf_counter() - started)
+    report["batch"] = {name: percentiles(values) for name, values in batch_latencies.items()}
+    return report
+
+
+def main() -> None:
+    load_dotenv()
+
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--k", type=int, default=24)
+    arg_parser.add_argument("--filtered-k", type=int, default=60)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--fixture", action="store_true")
+    arg_parser.add_argument("--embeddings", choices=["model", "fake"], default="model")
+    args = arg_parser.parse_args()
+
+    embeddings_model = create_embeddings(args.embeddings)
+    with tempfile.TemporaryDirectory(prefix="bench-flat-") as workdir:
+        if args.fixture:
+            vector_db_path = os.path.join(workdir, "chroma")
+            build_fixture_index(embeddings_model, vector_db_path)
+        else:
+            vector_db_path, _ = resolve_current_index(os.environ["VECTOR_DB_PATH"])
+        vectordb = Chroma(persist_directory=vector_db_path)
+        report = run(vectordb, embeddings_model, args, workdir)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/catalog.sqlite3")
+
+SCHEMA = """
+CREATE TABLE programs (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL UNIQUE,
+    description TEXT,
+    career TEXT
+);
+CREATE TABLE courses (
+    id INTEGER PRIMARY KEY,
+    program_id INTEGER NOT NULL REFERENCES programs (id),
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    block TEXT,
+    semester INTEGER,
+    hours INTEGER,
+    credits INTEGER
+);
+CREATE INDEX courses_program_semester ON courses (program_id, semester);
+CREATE INDEX courses_name_key ON courses (name_key);
+CREATE INDEX courses_block ON courses (block);
+"""
+
+
+def normalize_name(text: str) -> str:
+    """Ключ для сравнения названий: регистр, ё и пробелы не важны."""
+    return " ".join(text.replace("ё", "е").replace("Ё", "Е").split()).casefold()
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def build_catalog(programs_data: list, db_path: str = CATALOG_PATH) -> dict:
+    """
+    Собирает SQLite-каталог программ и дисциплин из structured_programs.json.
+    Файл пишется рядом под временным именем и подменяется атомарно,
+    поэтому backend никогда не читает недостроенный каталог.
+    """
+    target = Path(db_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.tmp")
+    tmp.unlink(missing_ok=True)
+
+    courses = 0
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            for program in programs_data:
+                program_id = conn.execute(
+                    "INSERT INTO programs (title, url, description, career) VALUES (?, ?, ?, ?)",
+                    (
+                        program["title"],
+                        program["url"],
+                        program.get("description"),
+                        program.get("career"),
+                    ),
+                ).lastrowid
+                rows = [
+                    (
+                        program_id,
+                        course["Дисциплина"],
+                        normalize_name(course["Дисциплина"]),
+                        course.get("Тип"),
+                        _to_int(course.get("Семестр")),
+                        _to_int(course.get("Трудоемкость в часах")),
+                        _to_int(course.get("Трудоемкость в з.е.")),
+                    )
+                    for course in program["courses"]
+                ]
+                conn.executemany(
+                    "INSERT INTO courses"
+                    " (program_id, name, name_key, block, semester, hours, credits)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                courses += len(rows)
+    finally:
+        conn.close()
+
+    os.replace(tmp, target)
+    return {"programs": len(programs_data), "courses": courses}
@@ -0,0 +1,184 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from pypdf import PdfReader
+
+# Сколько страниц PDF обрабатывает один воркер за раз
+PAGES_PER_TASK = 4
+# Пул процессов используется только для PDF от стольких страниц. Каждая задача
+# передает воркеру весь PDF и открывает его заново, поэтому на учебных планах
+# abit.itmo.ru (~25 страниц) параллельный разбор медленнее последовательного
+# (см. benchmarks/bench_curriculum_parser.py)
+PARALLEL_MIN_PAGES = int(os.getenv("CURRICULUM_PARALLEL_MIN_PAGES", "64"))
+
+# Общий для всех вызовов пул: parser.py разбирает PDF из нескольких потоков,
+# и отдельный пул на каждый PDF запускал бы потоки x workers интерпретаторов
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def parse_curriculum_text(pdf_file, workers: Optional[int] = None) -> list:
+    """
+    Извлекает список дисциплин из сырого текста PDF.
+    Это самая хрупкая часть, т.к. зависит от формата PDF.
+    """
+    return list(iter_curriculum_disciplines(pdf_file, workers=workers))
+
+
+def iter_curriculum_disciplines(pdf_file, workers: Optional[int] = None) -> Iterator[dict]:
+    """
+    Генератор дисциплин из PDF учебного плана.
+    При workers > 1 текст страниц больших PDF (от PARALLEL_MIN_PAGES страниц)
+    извлекается параллельно в общем пуле процессов, а дисциплины отдаются по мере готовности страниц в исходном порядке.
+    """
+    line_parser = CurriculumLineParser()
+    for text in iter_page_texts(pdf_file, workers=workers):
+        if not text:
+            continue
+        for line in text.split("\n"):
+            discipline = line_parser.feed(line)
+            if discipline is not None:
+                yield discipline
+
+
+def iter_page_texts(pdf_file, workers: Optional[int] = None) -> Iterator[str]:
+    """Отдает текст страниц PDF по порядку."""
+    workers = workers if workers is not None else 1
+    if isinstance(pdf_file, (bytes, bytearray)):
+        pdf_file = io.BytesIO(pdf_file)
+    if workers <= 1:
+        for page in PdfReader(pdf_file).pages:
+            yield page.extract_text()
+        return
+
+    pdf_bytes = _read_bytes(pdf_file)
+    page_count = len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    if page_count < PARALLEL_MIN_PAGES:
+        for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+            yield page.extract_text()
+        return
+
+    ranges = [
+        (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    chunks = _get_pool(workers).map(
+        _extract_pages_text,
+        [pdf_bytes] * len(ranges),
+        [start for start, _ in ranges],
+        [stop for _, stop in ranges],
+    )
+    for chunk in chunks:
+        yield from chunk
+
+
+def shutdown_pool() -> None:
+    """Останавливает общий пул процессов (если он был запущен)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            # spawn, а не fork: функцию вызывают из потоков загрузки parser.py,
+            # а fork многопоточного процесса может унести в дочерний чужие захваченные блокировки
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+class CurriculumLineParser:
+    """Построчный разбор текста учебного плана с сохранением текущего блока и семестра."""
+
+    def __init__(self):
+        self.current_block = None
+        self.current_semester = None
+
+    def feed(self, line: str) -> Optional[dict]:
+        """Обрабатывает строку и возвращает дисциплину, если строка ее описывает."""
+        line = line.strip()
+
+        intensity_hour = None
+        intensity_ze = None
+
+        if not line:
+            return None
+
+        if "Блок" in line:
+            self.current_block = line
+            return None
+
+        splitted_line = line.split()
+
+        # Определение семестра (цифра в начале строки или отдельно)
+        if splitted_line[0].isdigit():
+            self.current_semester = splitted_line[0]
+
+        # Определяем Трудоемкость в з.е. и в час
+        if splitted_line[-2].isdigit():
+            intensity_ze = splitted_line[-2]
+
+        if splitted_line[-1].isdigit():
+            intensity_hour = splitted_line[-1]
+
+        # Пропускаем строки с трудоемкостью и пустые/служебные строки
+        if "Трудоемкость" in line or line.replace(" ", "").isdigit():
+            return None
+
+        if not (self.current_semester and self.current_block):
+            return None
+
+        # Убираем номер семестра и трудоемкость из названия дисциплины (если есть).
+        # Порядок замен важен: от него зависит итоговое название.
+        discipline_name = line.replace(self.current_semester, "").strip()
+        if intensity_hour:
+            discipline_name = discipline_name.replace(intensity_hour, "").strip()
+        if intensity_ze:
+            discipline_name = discipline_name.replace(intensity_ze, "").strip()
+
+        if discipline_name.startswith(
+            ("Обязательные дисциплины", "Пул выборных дисциплин")
+        ):
+            return None
+
+        return {
+            "Дисциплина": discipline_name,
+            "Тип": self.current_block,
+            "Семестр": self.current_semester,
+            "Трудоемкость в часах": intensity_hour,
+            "Трудоемкость в з.е.": intensity_ze,
+        }
+
+
+def _extract_pages_text(pdf_bytes: bytes, start: int, stop: int) -> list:
+    # Выполняется в дочернем процессе: PdfReader не сериализуется, открываем заново
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def _read_bytes(pdf_file) -> bytes:
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return f.read()
+    pdf_file.seek(0)
+    return pdf_file.read()
@@ -0,0 +1,105 @@
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HostRateLimiter:
+    """Гарантирует минимальный интервал между запросами к одному хосту."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_allowed: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CachedResponse:
+    """Ответ из кэша или из сети. not_modified=True, если сервер вернул 304."""
+
+    def __init__(self, url: str, content: bytes, not_modified: bool, cache_key: str):
+        self.url = url
+        self.content = content
+        self.not_modified = not_modified
+        self.cache_key = cache_key
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+class CachedSession:
+    """
+    Потокобезопасная сессия с пулом соединений, ограничением частоты запросов
+    к хосту и дисковым кэшем ответов с условными запросами (ETag / Last-Modified).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        pool_size: int = 16,
+        min_interval: float = 0.5,
+        timeout: float = 15,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(min_interval)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str) -> CachedResponse:
+        """GET с условными заголовками; при 304 тело берется из кэша."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        meta_path = self.cache_dir / f"{key}.json"
+        body_path = self.cache_dir / f"{key}.body"
+
+        headers = {}
+        meta = {}
+        if meta_path.exists() and body_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        self.rate_limiter.wait(url)
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        if resp.status_code == 304 and meta:
+            return CachedResponse(url, body_path.read_bytes(), True, key)
+
+        resp.raise_for_status()
+        body_path.write_bytes(resp.content)
+        meta_path.write_text(
+            json.dumps(
+                {
+                    "url": url,
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        return CachedResponse(url, resp.content, False, key)
+
+    def derived_path(self, response: CachedResponse, name: str) -> Path:
+        """Путь для данных, вычисленных из тела ответа (например, результата парсинга)."""
+        return self.cache_dir / f"{response.cache_key}.{name}"
@@ -1,16 +1,59 @@
 import os
 import json
+import time
+import uuid
+import shutil
+import hashlib
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
 from langchain.docstore.document import Document
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+from vector_cache import CachedEmbeddings, VectorCache
 
 load_dotenv()
 
 RAW_DATA_PATH = "data/structured_programs.json"
 VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+# Тот же выбор бэкенда, что и в backend/app/embeddings.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_INT8_FILE = os.getenv(
+    "EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx"
+)
+# Backend сбрасывает кэш ответов, когда содержимое этого файла меняется
+INDEX_VERSION_FILENAME = "index_version"
+# Каждая сборка пишется в VECTOR_DB_PATH/versions/<версия> и публикуется
+# атомарной подменой симлинка VECTOR_DB_PATH/current (см. backend/app/vector_index.py)
+VERSIONS_DIR = "versions"
+CURRENT_LINK = "current"
+# Сколько последних версий хранить: backend может еще дорабатывать запросы со старой
+INDEX_VERSIONS_TO_KEEP = int(os.getenv("INDEX_VERSIONS_TO_KEEP", "3"))
+# Сколько документов отправлять в Chroma за один вызов
+UPSERT_BATCH_SIZE = 256
+# Эмбеддинги документов: кэш по хэшу текста (общий для запусков),
+# размер батча и число процессов, считающих промахи кэша
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+INDEX_EMBEDDING_BATCH_SIZE = int(os.getenv("INDEX_EMBEDDING_BATCH_SIZE", "64"))
+INDEX_EMBEDDING_WORKERS = int(
+    os.getenv("INDEX_EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+
+def embedding_model_kwargs(backend: str) -> dict:
+    """Параметры SentenceTransformer для бэкенда: torch, onnx или onnx-int8."""
+    if backend == "torch":
+        return {"device": "cpu"}
+    if backend == "onnx":
+        return {"device": "cpu", "backend": "onnx"}
+    if backend == "onnx-int8":
+        return {
+            "device": "cpu",
+            "backend": "onnx",
+            "model_kwargs": {"file_name": EMBEDDING_ONNX_INT8_FILE},
+        }
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}")
 
 
 def load_structured_data(filepath: str) -> list:
@@ -18,9 +61,27 @@ def load_structured_data(filepath: str) -> list:
     return json.loads(Path(filepath).read_text(encoding="utf-8"))
 
 
+def make_document_id(program_url: str, course_name: str = "", semester: str = "") -> str:
+    """Детерминированный ID документа: URL программы + дисциплина + семестр."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{program_url}|{course_name}|{semester}"))
+
+
+def content_hash(document: Document) -> str:
+    """Хэш текста и метаданных документа (без самого хэша)."""
+    metadata = {k: v for k, v in document.metadata.items() if k != "content_hash"}
+    payload = document.page_content + json.dumps(
+        metadata, ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def create_documents_from_data(programs_data: list) -> list[Document]:
-    """Преобразует JSON данные в список объектов Document для LangChain."""
+    """
+    Преобразует JSON данные в список объектов Document для LangChain.
+    Каждый документ получает стабильный ID и хэш содержимого в метаданных.
+    """
     documents = []
+    seen_ids = set()
 
     for program in programs_data:
         general_content = (
@@ -30,6 +91,7 @@ def create_documents_from_data(programs_data: list) -> list[Document]:
         )
         documents.append(
             Document(
+                id=make_document_id(program["url"]),
                 page_content=general_content,
                 metadata={
                     "source": program["url"],
@@ -46,8 +108,21 @@ def create_documents_from_data(programs_data: list) -> list[Document]:
                 f"Эта дисциплина относится к программе '{program['title']}'."
                 f"Трудоемкость в часах: {course['Трудоемкость в часах']}"
             )
+            course_id = make_document_id(
+                program["url"], course["Дисциплина"], course["Семестр"]
+            )
+            # Одна и та же дисциплина может встретиться в семестре дважды
+            # (например, в разных блоках) — делаем ID уникальным, сохраняя стабильность.
+            duplicate_index = 1
+            unique_id = course_id
+            while unique_id in seen_ids:
+                duplicate_index += 1
+                unique_id = f"{course_id}-{duplicate_index}"
+            seen_ids.add(unique_id)
+
             documents.append(
                 Document(
+                    id=unique_id,
                     page_content=course_content,
                     metadata={
                         "source": program["url"],
@@ -59,9 +134,64 @@ def create_documents_from_data(programs_data: list) -> list[Document]:
                 )
             )
 
+    for document in documents:
+        document.metadata["content_hash"] = content_hash(document)
+
     return documents
 
 
+def sync_vector_store(
+    vectordb: Chroma,
+    documents: list[Document],
+    embeddings: Optional[CachedEmbeddings] = None,
+) -> dict:
+    """
+    Приводит коллекцию к переданному набору документов:
+    добавляет новые, обновляет изменившиеся, удаляет исчезнувшие.
+    Если передан embeddings, эмбеддинги всех новых и изменившихся документов
+    считаются заранее одним вызовом (батчами в пуле процессов),
+    а Chroma затем берет их из кэша.
+    """
+    existing = vectordb.get(include=["metadatas"])
+    existing_hashes = {
+        doc_id: (metadata or {}).get("content_hash")
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+
+    to_add, to_update = [], []
+    for document in documents:
+        if document.id not in existing_hashes:
+            to_add.append(document)
+        elif existing_hashes[document.id] != document.metadata["content_hash"]:
+            to_update.append(document)
+
+    current_ids = {document.id for document in documents}
+    to_delete = [doc_id for doc_id in existing_hashes if doc_id not in current_ids]
+
+    if embeddings is not None:
+        embeddings.prefetch([document.page_content for document in to_add + to_update])
+
+    for batch in _batches(to_add):
+        vectordb.add_documents(batch, ids=[document.id for document in batch])
+    for batch in _batches(to_update):
+        vectordb.update_documents([document.id for document in batch], batch)
+    for batch in _batches(to_delete):
+        vectordb.delete(ids=batch)
+
+    return {
+        "added": len(to_add),
+        "updated": len(to_update),
+        "deleted": len(to_delete),
+        "skipped": len(documents) - len(to_add) - len(to_update),
+    }
+
+
+def _batches(items: list) -> list:
+    return [
+        items[i : i + UPSERT_BATCH_SIZE] for i in range(0, len(items), UPSERT_BATCH_SIZE)
+    ]
+
+
 def main():
     print("[indexer] Starting indexing process...")
 
@@ -73,18 +203,93 @@ def main():
     documents = create_documents_from_data(programs_data)
     print(f"[indexer] Created {len(documents)} documents to be indexed.")
 
-    print(f"[indexer] Initializing embedding model: {EMBEDDING_MODEL}")
-    embeddings = HuggingFaceEmbeddings(
+    print(
+        f"[indexer] Initializing embedding model: {EMBEDDING_MODEL} ({EMBEDDING_BACKEND})"
+    )
+    embeddings = CachedEmbeddings(
         model_name=EMBEDDING_MODEL,
-        model_kwargs={"device": "cpu"},
+        model_kwargs=embedding_model_kwargs(EMBEDDING_BACKEND),
+        cache=VectorCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, EMBEDDING_BACKEND),
+        workers=INDEX_EMBEDDING_WORKERS,
+        batch_size=INDEX_EMBEDDING_BATCH_SIZE,
     )
 
-    print(f"[indexer] Creating vector store at: {VECTOR_DB_PATH}")
-    Chroma.from_documents(
-        documents=documents, embedding=embeddings, persist_directory=VECTOR_DB_PATH
+    version = new_index_version()
+    build_path = prepare_build_directory(VECTOR_DB_PATH, version)
+    print(f"[indexer] Syncing vector store at: {build_path}")
+    vectordb = Chroma(persist_directory=str(build_path), embedding_function=embeddings)
+    try:
+        summary = sync_vector_store(vectordb, documents, embeddings)
+    finally:
+        embeddings.close()
+    print(
+        "[indexer] Added: {added}, updated: {updated}, deleted: {deleted}, "
+        "skipped (unchanged): {skipped}.".format(**summary)
     )
+    print(
+        "[indexer] Embeddings: {texts} texts, {cache_hits} from cache ({cache_hit_rate:.0%}), "
+        "{computed} computed at {docs_per_second:.1f} docs/s "
+        "({workers} workers, batch {batch_size}).".format(**embeddings.stats())
+    )
+
+    if summary["added"] or summary["updated"] or summary["deleted"]:
+        write_index_version(str(build_path), version)
+        publish_index_version(VECTOR_DB_PATH, version)
+        print(f"[indexer] Indexing complete. Published index version {version}.")
+    else:
+        shutil.rmtree(build_path, ignore_errors=True)
+        print("[indexer] Index is up to date, nothing to do.")
+
+
+def write_index_version(vector_db_path: str, version: Optional[str] = None) -> str:
+    """Записывает новую версию индекса, чтобы backend инвалидировал кэши."""
+    version = version or uuid.uuid4().hex
+    Path(vector_db_path, INDEX_VERSION_FILENAME).write_text(version, encoding="utf-8")
+    return version
+
+
+def new_index_version() -> str:
+    # Время в начале имени: версии сортируются по порядку сборки
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def prepare_build_directory(root: str, version: str) -> Path:
+    """
+    Папка для новой версии — копия опубликованной (или индекса, собранного
+    до появления версий), чтобы синхронизация пересчитала только изменения.
+    Опубликованные версии не меняются: их могут читать работающие воркеры.
+    """
+    build_path = Path(root, VERSIONS_DIR, version)
+    build_path.parent.mkdir(parents=True, exist_ok=True)
+    current = Path(root, CURRENT_LINK)
+    # Выгрузку плоского индекса backend делает сам для каждой версии
+    if current.exists():
+        shutil.copytree(
+            current.resolve(), build_path, ignore=shutil.ignore_patterns("flat_index")
+        )
+    elif Path(root, "chroma.sqlite3").exists():
+        shutil.copytree(
+            root,
+            build_path,
+            ignore=shutil.ignore_patterns(
+                VERSIONS_DIR, CURRENT_LINK, ".current-*", "flat_index"
+            ),
+        )
+    else:
+        build_path.mkdir()
+    return build_path
+
+
+def publish_index_version(root: str, version: str) -> None:
+    """Атомарно переключает симлинк current на версию и удаляет самые старые версии."""
+    tmp_link = Path(root, f".current-{uuid.uuid4().hex}")
+    tmp_link.symlink_to(Path(VERSIONS_DIR, version))
+    os.replace(tmp_link, Path(root, CURRENT_LINK))
 
-    print("[indexer] Indexing complete. Vector store saved.")
+    versions = sorted(Path(root, VERSIONS_DIR).iterdir(), key=lambda path: path.name)
+    for stale in versions[:-INDEX_VERSIONS_TO_KEEP]:
+        if stale.name != version:
+            shutil.rmtree(stale, ignore_errors=True)
 
 
 if __name__ == "__main__":
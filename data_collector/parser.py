@@ -1,11 +1,16 @@
+import os
 import re
 import io
 import json
 import requests
 from pathlib import Path
-from pypdf import PdfReader
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 
+from catalog import CATALOG_PATH, build_catalog
+from http_cache import CachedSession
+from curriculum import default_workers, parse_curriculum_text, shutdown_pool
+
 BASE_URLS = [
     "https://abit.itmo.ru/program/master/ai",
     "https://abit.itmo.ru/program/master/ai_product",
@@ -14,13 +19,26 @@ BASE_URLS = [
 # Регулярное выражение для поиска ID программы в javascript коде на странице
 PROGRAM_ID_PATTERN = re.compile(r'"apiProgram":{"id":(\d+)')
 
+HTTP_CACHE_DIR = "data/http_cache"
+# Сколько программ обрабатывается параллельно
+MAX_WORKERS = 8
+# Минимальный интервал между запросами к одному хосту, сек.
+PER_HOST_MIN_INTERVAL = 0.5
+# Увеличивайте при изменении логики парсинга PDF, чтобы сбросить кэш результатов
+CURRICULUM_PARSER_VERSION = 1
+# Сколько процессов извлекают текст страниц больших PDF (0 — по числу ядер).
+# По умолчанию 1: учебные планы короткие, и пул процессов их только замедляет
+CURRICULUM_PARSE_WORKERS = int(os.getenv("CURRICULUM_PARSE_WORKERS", "1")) or default_workers()
+
+session = CachedSession(
+    HTTP_CACHE_DIR, pool_size=MAX_WORKERS, min_interval=PER_HOST_MIN_INTERVAL
+)
+
 
 def fetch_page(url: str) -> str:
     """Загружает HTML страницы."""
     try:
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
-        return resp.text
+        return session.get(url).text
     except requests.RequestException as e:
         print(f"Error fetching {url}: {e}")
         return ""
@@ -31,93 +49,28 @@ def fetch_and_parse_pdf(program_id: str) -> list:
     pdf_url = f"https://api.itmo.su/constructor-ep/api/v1/static/programs/{program_id}/plan/abit/pdf"
     print(f"[parser] fetching curriculum from {pdf_url}")
     try:
-        response = requests.get(pdf_url, timeout=15)
-        response.raise_for_status()
+        response = session.get(pdf_url)
 
-        pdf_file = io.BytesIO(response.content)
+        # Неизмененный PDF не скачивается (304) и не парсится повторно
+        parsed_path = session.derived_path(
+            response, f"courses.v{CURRICULUM_PARSER_VERSION}.json"
+        )
+        if response.not_modified and parsed_path.exists():
+            print(f"[parser] curriculum for {program_id} not modified, using cache")
+            return json.loads(parsed_path.read_text(encoding="utf-8"))
 
-        return parse_curriculum_text(pdf_file)
+        pdf_file = io.BytesIO(response.content)
+        disciplines = parse_curriculum_text(pdf_file, workers=CURRICULUM_PARSE_WORKERS)
+        parsed_path.write_text(
+            json.dumps(disciplines, ensure_ascii=False), encoding="utf-8"
+        )
+        return disciplines
 
     except requests.RequestException as e:
         print(f"Error fetching or parsing PDF for program_id {program_id}: {e}")
         return []
 
 
-def parse_curriculum_text(pdf_file) -> list:
-    """
-    Извлекает список дисциплин из сырого текста PDF.
-    Это самая хрупкая часть, т.к. зависит от формата PDF.
-    """
-
-    reader = PdfReader(pdf_file)
-    disciplines = []
-    current_block = None
-    current_semester = None
-
-    for page in reader.pages:
-        text = page.extract_text()
-        if not text:
-            continue
-
-        lines = text.split("\n")
-        for line in lines:
-            line = line.strip()
-
-            intensity_hour = None
-            intensity_ze = None
-
-            if not line:
-                continue
-
-            if "Блок" in line:
-                current_block = line
-                continue
-
-            splitted_line = line.split()
-
-            # Определение семестра (цифра в начале строки или отдельно)
-            if splitted_line[0].isdigit():
-                current_semester = splitted_line[0]
-
-            # Определяем Трудоемкость в з.е. и в час
-            if splitted_line[-2].isdigit():
-                intensity_ze = splitted_line[-2]
-
-            if splitted_line[-1].isdigit():
-                intensity_hour = splitted_line[-1]
-
-            # Пропускаем строки с трудоемкостью и пустые/служебные строки
-            if "Трудоемкость" in line or line.replace(" ", "").isdigit():
-                continue
-
-            if current_semester and current_block and line:
-                # Убираем номер семестра из названия дисциплины (если есть)
-                discipline_name = line.replace(current_semester, "").strip()
-                if intensity_hour:
-                    discipline_name = (
-                        discipline_name.replace(intensity_hour, "").strip()
-                    )
-                
-                if intensity_ze:
-                    discipline_name = (
-                        discipline_name.replace(intensity_ze, "").strip()
-                    )
-                if not discipline_name.startswith(
-                    "Обязательные дисциплины"
-                ) and not discipline_name.startswith("Пул выборных дисциплин"):
-                    disciplines.append(
-                        {
-                            "Дисциплина": discipline_name,
-                            "Тип": current_block,
-                            "Семестр": current_semester,
-                            "Трудоемкость в часах": intensity_hour,
-                            "Трудоемкость в з.е.": intensity_ze,
-                        }
-                    )
-
-    return disciplines
-
-
 def parse_program_page(html: str, program_url: str) -> dict:
     """
     Парсит описание программы и учебный план.
@@ -170,18 +123,31 @@ def save_json(data: list, filename: str):
     )
 
 
+def collect_program(url: str):
+    """Скачивает и парсит страницу программы вместе с учебным планом."""
+    print(f"[parser] fetching {url}")
+    html = fetch_page(url)
+    if not html:
+        return None
+    return parse_program_page(html, url)
+
+
 def main():
-    all_data = []
-    for url in BASE_URLS:
-        print(f"[parser] fetching {url}")
-        html = fetch_page(url)
-        if html:
-            program_data = parse_program_page(html, url)
-            all_data.append(program_data)
+    # Программы обрабатываются параллельно, порядок результатов сохраняется
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(collect_program, BASE_URLS))
+    shutdown_pool()
+    all_data = [program_data for program_data in results if program_data]
 
     save_json(all_data, "data/structured_programs.json")
     print("[parser] Done. Saved to data/structured_programs.json")
 
+    summary = build_catalog(all_data, CATALOG_PATH)
+    print(
+        f"[parser] Course catalog with {summary['programs']} programs and "
+        f"{summary['courses']} courses saved to {CATALOG_PATH}"
+    )
+
 
 if __name__ == "__main__":
     main()
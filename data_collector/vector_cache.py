@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import multiprocessing
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+VECTORS_FILENAME = "vectors.f32"
+KEYS_FILENAME = "keys.txt"
+META_FILENAME = "meta.json"
+LOCK_FILENAME = ".lock"
+
+
+def text_hash(text: str) -> str:
+    """Ключ кэша: хэш текста, который подается в модель."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VectorCache:
+    """
+    Дисковый кэш эмбеддингов, общий для запусков и программ.
+    Для каждой пары (модель, бэкенд) — своя папка:
+    vectors.f32 — матрица float32 [строки x dim], читается через np.memmap;
+    keys.txt    — хэш текста на строку, номер строки = номер вектора.
+    Запись только дописывает в конец под файловой блокировкой: сначала векторы,
+    потом ключи, поэтому оборванная запись не оставляет ключей без векторов.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, backend: str):
+        slug = re.sub(r"[^\w.-]+", "_", f"{model_name}__{backend}")
+        self.path = Path(cache_dir) / slug
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.backend = backend
+        self.dim: Optional[int] = None
+        self._rows: "dict[str, int]" = {}
+        self._vectors: Optional[np.memmap] = None
+        self._keys_size = 0
+        self._line_count = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def get_many(self, keys: list) -> "dict[str, np.ndarray]":
+        """Векторы для найденных в кэше ключей."""
+        self._refresh()
+        found = {}
+        for key in keys:
+            row = self._rows.get(key)
+            if row is not None:
+                found[key] = np.array(self._vectors[row])
+        return found
+
+    def put_many(self, keys: list, vectors) -> None:
+        """Дописывает векторы для ключей, которых еще нет в кэше."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        with self._locked():
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}"
+                )
+
+            new_rows = {}
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in new_rows:
+                    new_rows[key] = i
+            if not new_rows:
+                return
+
+            # Число строк берется с диска: другой процесс мог дописать кэш
+            # после того, как этот экземпляр прочитал keys.txt
+            rows = self._disk_rows()
+            vectors_path = self.path / VECTORS_FILENAME
+            if rows and (
+                not vectors_path.exists() or vectors_path.stat().st_size < rows * self.dim * 4
+            ):
+                raise RuntimeError(f"Vector cache {self.path} is corrupted: fewer vectors than keys")
+            with open(vectors_path, "r+b" if vectors_path.exists() else "wb") as f:
+                # Хвост от оборванной записи (векторы без ключей) перезаписывается
+                f.truncate(rows * self.dim * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(vectors[list(new_rows.values())].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.path / KEYS_FILENAME, "a", encoding="ascii") as f:
+                f.write("".join(f"{key}\n" for key in new_rows))
+            self._refresh()
+
+    def _load(self) -> None:
+        self._refresh()
+
+    def _read_meta(self) -> None:
+        meta_path = self.path / META_FILENAME
+        if meta_path.exists():
+            self.dim = json.loads(meta_path.read_text(encoding="utf-8"))["dim"]
+
+    def _disk_rows(self) -> int:
+        """
+        Число полных строк в keys.txt (вызывается под блокировкой).
+        Оборванная последняя строка отрезается, чтобы новые ключи не склеились с ней.
+        """
+        keys_path = self.path / KEYS_FILENAME
+        if not keys_path.exists():
+            return 0
+        with open(keys_path, "r+b") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete != len(data):
+                f.truncate(complete)
+        return data.count(b"\n")
+
+    def _refresh(self) -> None:
+        """Подхватывает строки, дописанные этим или другим процессом."""
+        if self.dim is None:
+            # Кэш мог быть создан другим процессом после открытия этого экземпляра
+            self._read_meta()
+        keys_path = self.path / KEYS_FILENAME
+        if self.dim is None or not keys_path.exists():
+            return
+        size = keys_path.stat().st_size
+        if size == self._keys_size:
+            return
+        with open(keys_path, "r", encoding="ascii") as f:
+            f.seek(self._keys_size)
+            tail = f.read()
+        # Неполную последнюю строку дочитаем в следующий раз
+        complete = tail[: tail.rfind("\n") + 1]
+        for key in complete.splitlines():
+            # Номер строки в keys.txt — номер вектора в vectors.f32
+            self._rows.setdefault(key, self._line_count)
+            self._line_count += 1
+        self._keys_size += len(complete)
+
+        rows = self._line_count
+        self._vectors = (
+            np.memmap(self.path / VECTORS_FILENAME, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            if rows
+            else None
+        )
+
+    def _write_meta(self) -> None:
+        meta = {"model": self.model_name, "backend": self.backend, "dim": self.dim}
+        (self.path / META_FILENAME).write_text(json.dumps(meta), encoding="utf-8")
+
+    @contextmanager
+    def _locked(self):
+        """Эксклюзивная блокировка записи между процессами."""
+        with open(self.path / LOCK_FILENAME, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Модель в процессе-воркере пула (загружается один раз в initializer)
+_worker_model = None
+
+
+def _init_worker(model_name: str, model_kwargs: dict, threads: int) -> None:
+    global _worker_model
+    # Импорт здесь: torch грузится только там, где действительно считаются эмбеддинги
+    import torch
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+    # Иначе каждый воркер займет все ядра, и они будут мешать друг другу
+    torch.set_num_threads(threads)
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+
+
+def _embed_batch(texts: list) -> np.ndarray:
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Эмбеддинги документов для индексера: сначала из VectorCache,
+    промахи считаются батчами по batch_size в пуле из workers процессов
+    и сразу дописываются в кэш. Пул и модель создаются при первом промахе,
+    так что повторная индексация без изменений модель не загружает.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_kwargs: dict,
+        cache: VectorCache,
+        workers: int = 1,
+        batch_size: int = 64,
+    ):
+        self.model_name = model_name
+        self.model_kwargs = model_kwargs
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # Статистика по уникальным текстам: Chroma запрашивает уже
+        # посчитанные через prefetch эмбеддинги повторно
+        self._seen: "set[str]" = set()
+        self.cache_hits = 0
+        self.computed = 0
+        self.embed_seconds = 0.0
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [text_hash(text) for text in texts]
+        self.prefetch(texts, keys)
+        vectors = self.cache.get_many(keys)
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    def prefetch(self, texts: list, keys: Optional[list] = None) -> None:
+        """Досчитывает в кэш эмбеддинги текстов, которых в нем нет."""
+        keys = keys or [text_hash(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            cached = key in self.cache
+            if key not in self._seen:
+                self._seen.add(key)
+                self.cache_hits += cached
+            if not cached:
+                missing[key] = text
+        if not missing:
+            return
+
+        missing_keys = list(missing)
+        batches = [
+            missing_keys[i : i + self.batch_size]
+            for i in range(0, len(missing_keys), self.batch_size)
+        ]
+        print(
+            f"[indexer] Embedding {len(missing_keys)} texts in {len(batches)} batches "
+            f"on {self.workers} worker(s)"
+        )
+        started = time.perf_counter()
+        done = 0
+        results = self._map(_embed_batch, [[missing[key] for key in batch] for batch in batches])
+        for batch, vectors in zip(batches, results):
+            self.cache.put_many(batch, vectors)
+            done += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"[indexer] Embedded {done}/{len(missing_keys)} ({done / elapsed:.1f} docs/s)")
+        self.embed_seconds += time.perf_counter() - started
+        self.computed += len(missing_keys)
+
+    def stats(self) -> dict:
+        return {
+            "texts": len(self._seen),
+            "cache_hits": self.cache_hits,
+            "computed": self.computed,
+            "cache_hit_rate": self.cache_hits / len(self._seen) if self._seen else 0.0,
+            "docs_per_second": self.computed / self.embed_seconds if self.embed_seconds else 0.0,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _map(self, fn, batches: list):
+        if self.workers == 1:
+            if _worker_model is None:
+                _init_worker(self.model_name, self.model_kwargs, os.cpu_count() or 1)
+            return map(fn, batches)
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        if self._executor is None:
+            # spawn, а не fork: torch и его пулы потоков не переживают fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=min(self.workers, len(batches)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.model_kwargs, threads),
+            )
+        return self._executor.map(fn, batches)
@@ -1,9 +1,25 @@
 import os
+import json
+import time
+import random
+import asyncio
 import logging
-import requests
+import httpx
+import uvicorn
+from typing import Optional, Tuple
 
-from telegram import Update
-from telegram.constants import ChatAction
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Message, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,6 +29,8 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 
+from send_queue import TELEGRAM_MESSAGE_LIMIT, OutboundQueue
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
@@ -27,6 +45,131 @@ if not API_TOKEN or not BACKEND_URL:
     logger.error("Необходимо задать TELEGRAM_BOT_TOKEN и BACKEND_API_URL в .env файле")
     exit()
 
+BACKEND_STREAM_URL = os.getenv("BACKEND_STREAM_API_URL") or f"{BACKEND_URL.rstrip('/')}/stream"
+# Минимальный интервал между редактированиями сообщения (лимиты Telegram)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+
+# Пул соединений с бэкендом, таймауты и повторные попытки
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "32"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "120"))
+BACKEND_MAX_RETRIES = int(os.getenv("BACKEND_MAX_RETRIES", "3"))
+BACKEND_RETRY_BASE_DELAY = float(os.getenv("BACKEND_RETRY_BASE_DELAY", "0.5"))
+# Сколько апдейтов Telegram обрабатывается параллельно
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+# Порт HTTP-сервера с метриками Prometheus (0 — не запускать)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+
+# Режим получения апдейтов: polling или webhook (ASGI-сервер uvicorn)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный https-адрес, на который Telegram будет слать апдейты (без пути)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+
+# Лимиты отправки сообщений (ограничения Telegram: ~30 сообщений в секунду
+# на бота и ~1 в секунду на чат), число повторов после 429
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+
+# --- Метрики клиента бэкенда ---
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+BACKEND_REQUESTS = Counter(
+    "bot_backend_requests_total",
+    "Запросы бота к бэкенду по итогу обработки",
+    ["outcome"],
+)
+BACKEND_RESPONSE_SECONDS = Histogram(
+    "bot_backend_response_seconds",
+    "Время от отправки запроса до получения полного ответа бэкенда",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_FIRST_TOKEN_SECONDS = Histogram(
+    "bot_backend_first_token_seconds",
+    "Время от отправки запроса до первого фрагмента ответа",
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_RETRIES = Counter(
+    "bot_backend_retries_total",
+    "Повторные запросы к бэкенду",
+    ["reason"],
+)
+
+
+class BackendStreamError(Exception):
+    """Бэкенд сообщил об ошибке посреди потока ответа."""
+
+
+# --- Клиент бэкенда ---
+
+
+def create_backend_client() -> httpx.AsyncClient:
+    """Создает общий HTTP-клиент с keep-alive пулом соединений."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=BACKEND_POOL_SIZE,
+            max_keepalive_connections=BACKEND_POOL_SIZE,
+        ),
+        timeout=httpx.Timeout(
+            BACKEND_READ_TIMEOUT,
+            connect=BACKEND_CONNECT_TIMEOUT,
+            pool=BACKEND_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+async def open_backend_stream(client: httpx.AsyncClient, payload: dict) -> httpx.Response:
+    """
+    Открывает потоковый запрос к бэкенду. При ошибках соединения и ответах 5xx
+    повторяет запрос с экспоненциальной задержкой и случайным разбросом.
+    Вызывающий код должен закрыть ответ через response.aclose().
+    """
+    for attempt in range(BACKEND_MAX_RETRIES + 1):
+        is_last_attempt = attempt == BACKEND_MAX_RETRIES
+        try:
+            request = client.build_request("POST", BACKEND_STREAM_URL, json=payload)
+            response = await client.send(request, stream=True)
+        except httpx.TransportError as e:
+            if is_last_attempt:
+                raise
+            logger.warning(f"Ошибка соединения с API (попытка {attempt + 1}): {e}")
+            BACKEND_RETRIES.labels("connection").inc()
+        else:
+            if response.status_code < 500 or is_last_attempt:
+                return response
+            logger.warning(
+                f"API вернул {response.status_code} (попытка {attempt + 1}), повторяем запрос"
+            )
+            await response.aclose()
+            BACKEND_RETRIES.labels("status").inc()
+
+        delay = BACKEND_RETRY_BASE_DELAY * 2**attempt
+        await asyncio.sleep(random.uniform(0, delay))
+
+
+async def init_clients(application: Application) -> None:
+    application.bot_data["backend_client"] = create_backend_client()
+    application.bot_data["sender"] = OutboundQueue(
+        application.bot,
+        global_rate=TELEGRAM_GLOBAL_RATE,
+        chat_rate=TELEGRAM_CHAT_RATE,
+        chat_burst=TELEGRAM_CHAT_BURST,
+        max_retries=TELEGRAM_SEND_RETRIES,
+    )
+
+
+async def close_clients(application: Application) -> None:
+    await application.bot_data["backend_client"].aclose()
+
+
 # --- Хендлеры (обработчики команд и сообщений) ---
 
 
@@ -42,49 +185,192 @@ async def start(update: Update, context: CallbackContext) -> None:
         "✅ Помочь с выбором курсов на основе вашего бэкграунда.\n\n"
         "Просто задайте мне свой вопрос!"
     )
-    await update.message.reply_text(welcome_text)
+    await context.bot_data["sender"].send_text(update.effective_chat.id, welcome_text)
 
 
 async def handle_text_message(update: Update, context: CallbackContext) -> None:
-    """Пересылает текстовое сообщение пользователя на бэкенд и возвращает ответ."""
+    """
+    Пересылает текстовое сообщение пользователя на бэкенд и показывает ответ
+    по мере генерации, периодически редактируя сообщение.
+    """
     chat_id = str(update.effective_chat.id)
     query_text = update.message.text
+    sender: OutboundQueue = context.bot_data["sender"]
 
-    await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+    await sender.try_send_typing(chat_id)
 
-    payload = {"chat_id": chat_id, "query_text": query_text}
+    # Боту нужен только текст ответа: источники не запрашиваем
+    payload = {"chat_id": chat_id, "query_text": query_text, "sources": "none"}
+    started = time.monotonic()
+    backend_seconds = None
+    outcome = "ok"
 
     try:
-        response = requests.post(BACKEND_URL, json=payload, timeout=120)
-        response.raise_for_status()
+        reply = None
+        answer = ""
+        shown_text = ""
+        last_edit = 0.0
+
+        response = await open_backend_stream(context.bot_data["backend_client"], payload)
+        try:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+
+            first_token = True
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if first_token:
+                    BACKEND_FIRST_TOKEN_SECONDS.observe(time.monotonic() - started)
+                    first_token = False
+                if event["type"] == "token":
+                    answer += event["content"]
+                elif event["type"] == "final":
+                    answer = event["answer"]
+                elif event["type"] == "error":
+                    raise BackendStreamError(event["detail"])
 
-        data = response.json()
-        answer = data.get("answer", "Не удалось получить ответ от сервера.")
+                now = time.monotonic()
+                if (
+                    answer.strip()
+                    and answer != shown_text
+                    and now - last_edit >= STREAM_EDIT_INTERVAL
+                ):
+                    reply, shown = await _show_partial_answer(sender, chat_id, reply, answer)
+                    if shown:
+                        shown_text = answer
+                        last_edit = now
+        finally:
+            await response.aclose()
+        backend_seconds = time.monotonic() - started
 
-        await update.message.reply_text(answer, parse_mode="MARKDOWN")
+        answer = answer or "Не удалось получить ответ от сервера."
+        await sender.deliver(chat_id, answer, reply=reply, parse_mode="MARKDOWN")
 
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
+        outcome = "http_error"
         logger.error(
             f"Ошибка статуса от API: {e.response.status_code} - {e.response.text}"
         )
-        await update.message.reply_text(
-            "Прошу прощения, на сервере произошла ошибка. Попробуйте повторить запрос позже."
+        await sender.send_text(
+            chat_id,
+            "Прошу прощения, на сервере произошла ошибка. Попробуйте повторить запрос позже.",
         )
-    except requests.exceptions.RequestException as e:
+    except BackendStreamError as e:
+        outcome = "stream_error"
+        logger.error(f"Ошибка бэкенда во время генерации ответа: {e}")
+        await sender.send_text(
+            chat_id,
+            "Прошу прощения, на сервере произошла ошибка. Попробуйте повторить запрос позже.",
+        )
+    except httpx.RequestError as e:
+        outcome = "connection_error"
         logger.error(f"Ошибка подключения к API: {e}")
-        await update.message.reply_text(
-            "Не могу связаться с сервером. Пожалуйста, проверьте, что сервис запущен и доступен."
+        await sender.send_text(
+            chat_id,
+            "Не могу связаться с сервером. Пожалуйста, проверьте, что сервис запущен и доступен.",
         )
     except Exception as e:
+        outcome = "unexpected_error"
         logger.error(f"Произошла непредвиденная ошибка: {e}")
-        await update.message.reply_text(
-            "Что-то пошло не так. Мы уже разбираемся в проблеме."
+        await sender.send_text(
+            chat_id, "Что-то пошло не так. Мы уже разбираемся в проблеме."
         )
+    finally:
+        if backend_seconds is None:
+            backend_seconds = time.monotonic() - started
+        BACKEND_REQUESTS.labels(outcome).inc()
+        BACKEND_RESPONSE_SECONDS.labels(outcome).observe(backend_seconds)
+
+
+async def _show_partial_answer(
+    sender: OutboundQueue, chat_id: str, reply: Optional[Message], text: str
+) -> Tuple[Optional[Message], bool]:
+    """
+    Показывает промежуточный текст ответа (без разметки: она может быть незакрытой).
+    Правка пропускается, если чат упирается в лимиты Telegram; возвращает
+    сообщение с ответом и признак того, что текст обновлен.
+    """
+    if len(text) > TELEGRAM_MESSAGE_LIMIT:
+        text = text[: TELEGRAM_MESSAGE_LIMIT - 1] + "…"
+    if reply is None:
+        return await sender.send_text(chat_id, text), True
+    return reply, await sender.try_edit_text(reply, text)
+
+
+# --- Webhook-режим ---
+
+
+def create_webhook_app(application: Application) -> Starlette:
+    """ASGI-приложение, принимающее апдейты Telegram и отдающее метрики."""
+
+    async def telegram_webhook(request: Request) -> Response:
+        if (
+            WEBHOOK_SECRET_TOKEN
+            and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET_TOKEN
+        ):
+            return Response(status_code=403)
+        update = Update.de_json(await request.json(), application.bot)
+        await application.update_queue.put(update)
+        return Response()
+
+    async def health(request: Request) -> Response:
+        return PlainTextResponse("ok")
+
+    async def metrics(request: Request) -> Response:
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    return Starlette(
+        routes=[
+            Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]),
+            Route("/healthz", health),
+            Route("/metrics", metrics),
+        ]
+    )
+
+
+async def run_webhook(application: Application) -> None:
+    """
+    Регистрирует webhook и обслуживает его через uvicorn.
+    post_init/post_shutdown здесь вызываются вручную: их запускает только run_polling/run_webhook.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_webhook_app(application),
+            host=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            log_level="info",
+        )
+    )
+    async with application:
+        await init_clients(application)
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=min(CONCURRENT_UPDATES, 100),
+        )
+        await application.start()
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            await close_clients(application)
 
 
 def main() -> None:
     """Основная функция для запуска бота."""
-    application = Application.builder().token(API_TOKEN).build()
+    builder = Application.builder().token(API_TOKEN).concurrent_updates(CONCURRENT_UPDATES)
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logger.error("Для BOT_MODE=webhook необходимо задать WEBHOOK_URL")
+            exit()
+        # Апдейты приходят через наш ASGI-сервер, встроенный Updater не нужен
+        application = builder.updater(None).build()
+    else:
+        application = builder.post_init(init_clients).post_shutdown(close_clients).build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", start))
@@ -93,8 +379,16 @@ def main() -> None:
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message)
     )
 
-    logger.info("Запуск Telegram-бота...")
-    application.run_polling()
+    if BOT_METRICS_PORT:
+        start_http_server(BOT_METRICS_PORT)
+        logger.info(f"Метрики Prometheus доступны на порту {BOT_METRICS_PORT}")
+
+    if BOT_MODE == "webhook":
+        logger.info(f"Запуск Telegram-бота в режиме webhook на порту {WEBHOOK_PORT}...")
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("Запуск Telegram-бота...")
+        application.run_polling()
 
 
 if __name__ == "__main__":
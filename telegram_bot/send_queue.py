@@ -0,0 +1,244 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from prometheus_client import Counter, Histogram
+from telegram import Bot, Message
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Сколько чатов хранить в таблице ограничителей (самые давние вытесняются)
+MAX_TRACKED_CHATS = 10000
+
+SENT_MESSAGES = Counter(
+    "bot_sent_messages_total",
+    "Запросы к Telegram Bot API на отправку и редактирование",
+    ["method"],
+)
+SEND_RETRIES = Counter(
+    "bot_send_flood_retries_total",
+    "Повторы после ответа 429 (RetryAfter) от Telegram",
+)
+SEND_DROPPED = Counter(
+    "bot_send_dropped_total",
+    "Пропущенные необязательные запросы (промежуточные правки, статус набора)",
+)
+SEND_WAIT_SECONDS = Histogram(
+    "bot_send_wait_seconds",
+    "Ожидание в очереди отправки до вызова Telegram Bot API",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Делит текст на части не длиннее limit, по абзацам, строкам или словам."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих запросов к Telegram Bot API.
+    Запросы в один чат выполняются по порядку и не чаще chat_rate в секунду
+    (с запасом chat_burst), все запросы бота — не чаще global_rate в секунду.
+    Вместо ошибки на 429 запрос ждет retry_after и повторяется.
+    Необязательные запросы (промежуточные правки ответа, статус «печатает»)
+    при нехватке токенов пропускаются, а не ставятся в очередь.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+    ):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._chats: "OrderedDict[int | str, tuple[asyncio.Lock, TokenBucket]]" = OrderedDict()
+
+    async def send_text(self, chat_id, text: str, parse_mode: Optional[str] = None) -> Message:
+        return await self._submit(
+            chat_id,
+            "send_message",
+            lambda: self.bot.send_message(chat_id, text, parse_mode=parse_mode),
+        )
+
+    async def try_edit_text(self, message: Message, text: str) -> bool:
+        """Необязательная правка сообщения; False, если пропущена из-за лимитов."""
+        result = await self._submit(
+            message.chat_id,
+            "edit_message_text",
+            lambda: message.edit_text(text),
+            optional=True,
+        )
+        return result is not None
+
+    async def try_send_typing(self, chat_id) -> None:
+        await self._submit(
+            chat_id,
+            "send_chat_action",
+            lambda: self.bot.send_chat_action(chat_id, ChatAction.TYPING),
+            optional=True,
+        )
+
+    async def deliver(
+        self,
+        chat_id,
+        text: str,
+        reply: Optional[Message] = None,
+        parse_mode: Optional[str] = None,
+    ) -> None:
+        """
+        Отправляет итоговый текст, разбивая его на сообщения до 4096 символов.
+        Первая часть заменяет текст reply (если он есть), остальные уходят
+        новыми сообщениями. Если разметка не разбирается, часть отправляется без нее.
+        """
+        for i, chunk in enumerate(split_message(text)):
+            target = reply if i == 0 else None
+            try:
+                await self._send_or_edit(chat_id, target, chunk, parse_mode)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    continue
+                if parse_mode is None:
+                    raise
+                logger.warning(f"Не удалось отправить ответ с разметкой: {e}")
+                await self._send_or_edit(chat_id, target, chunk, None)
+
+    async def _send_or_edit(
+        self, chat_id, message: Optional[Message], text: str, parse_mode: Optional[str]
+    ) -> None:
+        if message is None:
+            await self.send_text(chat_id, text, parse_mode=parse_mode)
+        else:
+            await self._submit(
+                chat_id,
+                "edit_message_text",
+                lambda: message.edit_text(text, parse_mode=parse_mode),
+            )
+
+    async def _submit(
+        self,
+        chat_id,
+        method: str,
+        request: Callable[[], Awaitable],
+        optional: bool = False,
+    ):
+        lock, chat_bucket = self._chat_limits(chat_id)
+        if optional and lock.locked():
+            SEND_DROPPED.inc()
+            return None
+
+        queued = time.monotonic()
+        async with lock:
+            for attempt in range(self.max_retries + 1):
+                if optional:
+                    if not (chat_bucket.try_acquire() and self.global_bucket.try_acquire()):
+                        SEND_DROPPED.inc()
+                        return None
+                else:
+                    # Сначала лимит чата, потом общий: ожидая свою очередь в чате,
+                    # запрос не занимает общий токен
+                    await chat_bucket.acquire()
+                    await self.global_bucket.acquire()
+                if attempt == 0:
+                    SEND_WAIT_SECONDS.observe(time.monotonic() - queued)
+
+                try:
+                    result = await request()
+                except RetryAfter as e:
+                    if optional:
+                        SEND_DROPPED.inc()
+                        return None
+                    if attempt == self.max_retries:
+                        raise
+                    delay = _retry_after_seconds(e)
+                    SEND_RETRIES.inc()
+                    logger.warning(f"Telegram ограничил отправку в чат {chat_id}, ждем {delay} с")
+                    await asyncio.sleep(delay)
+                    continue
+                SENT_MESSAGES.labels(method).inc()
+                return result
+
+    def _chat_limits(self, chat_id) -> "tuple[asyncio.Lock, TokenBucket]":
+        # bot.py передает id чата то числом, то строкой — у чата должна быть одна очередь
+        chat_id = _chat_key(chat_id)
+        limits = self._chats.get(chat_id)
+        if limits is None:
+            limits = (asyncio.Lock(), TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = limits
+            # Вытесняем самые давние чаты, но не тот, в который сейчас идет отправка
+            while len(self._chats) > MAX_TRACKED_CHATS:
+                oldest_id, (oldest_lock, _) = next(iter(self._chats.items()))
+                if oldest_lock.locked():
+                    self._chats.move_to_end(oldest_id)
+                    break
+                del self._chats[oldest_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return limits
+
+
+def _chat_key(chat_id):
+    """Числовой id чата; "@username" канала остается строкой."""
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return chat_id
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)